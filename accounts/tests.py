@@ -1,3 +1,56 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from accounts.views import get_profile_counts
+from events.models import Enroll, Event, Favorite, Review
+
+
+@override_settings(ACCOUNTS_PROFILE_PAGE_SIZE=2)
+class ProfileSectionTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user')
+        self.other = User.objects.create_user('other')
+        self.events = [
+            Event.objects.create(title=f'Событие {i}', date_start=timezone.now(), participants_number=10)
+            for i in range(5)
+        ]
+        for event in self.events:
+            Enroll.objects.create(user=self.user, event=event)
+        Enroll.objects.create(user=self.other, event=self.events[0])
+        Review.objects.create(user=self.user, event=self.events[1], rate=4, text='Хорошее событие')
+        Favorite.objects.create(user=self.other, event=self.events[2])
+
+    def get_section(self, section, cursor=''):
+        return self.client.get(reverse('api_accounts:list_profile_section'),
+                               {'section': section, 'cursor': cursor}).json()
+
+    def test_section_requires_login_and_known_section(self):
+        self.assertEqual(self.get_section('enrolls')['ok'], False)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.get_section('users')['ok'], False)
+        self.assertEqual(self.get_section('enrolls', cursor='bad')['ok'], False)
+
+    def test_sections_are_paged_by_cursor(self):
+        self.client.force_login(self.user)
+        rows = []
+        cursor = ''
+        while cursor is not None:
+            data = self.get_section('enrolls', cursor)
+            self.assertLessEqual(len(data['rows']), 2)
+            rows += data['rows']
+            cursor = data['next_cursor']
+
+        # только записи пользователя, новые первыми, с его оценкой события
+        self.assertEqual([row['event'] for row in rows], [f'Событие {i}' for i in reversed(range(5))])
+        self.assertEqual({row['event']: row['rate'] for row in rows if row['rate']}, {'Событие 1': 4})
+        self.assertEqual(self.get_section('favorites')['rows'], [])
+        self.assertEqual([row['text'] for row in self.get_section('reviews')['rows']], ['Хорошее событие'])
+
+    def test_profile_counts(self):
+        with self.assertNumQueries(1):
+            counts = get_profile_counts(self.user)
+        self.assertEqual(counts, {'enroll_count': 5, 'review_count': 1, 'favorite_count': 0})
+        self.assertEqual(get_profile_counts(self.other), {'enroll_count': 1, 'review_count': 0, 'favorite_count': 1})
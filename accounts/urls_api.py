@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'api_accounts'
+
+urlpatterns = [
+    path('profile/section/', views.list_profile_section, name='list_profile_section'),
+]
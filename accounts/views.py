@@ -5,13 +5,72 @@ from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
-from django.http import HttpResponseRedirect
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect, JsonResponse
 from django.urls import reverse_lazy
+from django.utils.text import Truncator
 from django.views.generic import UpdateView, CreateView
 
 from accounts.forms import (ProfileUpdateForm, CustomPasswordResetForm, CustomSetPasswordForm, CustomUserCreationForm,
                             CustomAuthenticationForm)
 from accounts.models import Profile
+from events.models import Enroll, Favorite, Review
+from utils.pagination import CursorPaginator, InvalidCursor
+
+PROFILE_SECTIONS = ('enrolls', 'reviews', 'favorites')
+
+
+def get_profile_section_queryset(user, section):
+    # Из события нужны только название и дата, описание и прочие поля не читаются
+    if section == 'enrolls':
+        # оценка из отзыва пользователя на событие записи, по уникальному индексу (user, event)
+        user_rates = Review.objects.filter(user=OuterRef('user'), event=OuterRef('event')).values('rate')[:1]
+        return Enroll.objects.filter(user=user).select_related('event').only(
+            'user', 'event', 'event__title', 'event__date_start',
+        ).annotate(user_rate=Subquery(user_rates))
+    if section == 'reviews':
+        return Review.objects.filter(user=user).select_related('event').only(
+            'user', 'rate', 'text', 'event', 'event__title',
+        )
+    if section == 'favorites':
+        return Favorite.objects.filter(user=user).select_related('event').only('user', 'event', 'event__title')
+    raise ValueError(f'Неизвестный раздел профиля: {section}')
+
+
+def get_profile_section_page(user, section, cursor=None):
+    queryset = get_profile_section_queryset(user, section)
+    paginator = CursorPaginator(queryset, settings.ACCOUNTS_PROFILE_PAGE_SIZE, ordering=['-pk'])
+    return paginator.page(cursor)
+
+
+def get_profile_section_data(section, obj):
+    data = {
+        'event': obj.event.title,
+        'event_url': obj.event.get_absolute_url(),
+        'delete_url': obj.get_delete_url(),
+    }
+    if section == 'enrolls':
+        data['date_start'] = obj.event.date_start.strftime('%d.%m.%Y') if obj.event.date_start else ''
+        data['rate'] = obj.user_rate
+    elif section == 'reviews':
+        data['text'] = Truncator(obj.text).words(4)
+        data['rate'] = obj.rate
+    return data
+
+
+def get_profile_counts(user):
+    # Количество строк разделов одним запросом, каждое - подзапрос COUNT по индексу user_id
+    def count(model):
+        return Coalesce(Subquery(model.objects.filter(user=OuterRef('pk')).order_by().values('user').annotate(
+            count=Count('pk'),
+        ).values('count')), 0)
+
+    return User.objects.filter(pk=user.pk).values(
+        enroll_count=count(Enroll),
+        review_count=count(Review),
+        favorite_count=count(Favorite),
+    ).first()
 
 
 class RedirectAuthenticatedUserMixin:
@@ -48,7 +107,7 @@ class ProfileUpdateView(LoginRequiredMixin,UpdateView):
         self.kwargs['pk'] = pk
 
         queryset = super().get_queryset().filter(pk=pk)
-        queryset = queryset.select_related('user').prefetch_related('user__enrolls__event', 'user__reviews__event')
+        queryset = queryset.select_related('user')
 
         profile = super().get_object(queryset)
         return profile
@@ -65,6 +124,10 @@ class ProfileUpdateView(LoginRequiredMixin,UpdateView):
 
         context = super().get_context_data(**kwargs)
         context['title_profile'] = True
+        # Разделы профиля показывают первую страницу, следующие загружаются кнопкой «Показать еще»
+        context['profile_counts'] = get_profile_counts(profile.user)
+        for section in PROFILE_SECTIONS:
+            context[f'{section}_page'] = get_profile_section_page(profile.user, section)
         return context
 
     def form_valid(self, form):
@@ -72,6 +135,37 @@ class ProfileUpdateView(LoginRequiredMixin,UpdateView):
         return super().form_valid(form)
 
 
+def list_profile_section(request):
+    data = {
+        'ok': True,
+        'msg': '',
+        'rows': [],
+        'next_cursor': None,
+    }
+
+    if not request.user.is_authenticated:
+        data['msg'] = 'Пользователь не авторизован'
+        data['ok'] = False
+        return JsonResponse(data)
+
+    section = request.GET.get('section', '')
+    if section not in PROFILE_SECTIONS:
+        data['msg'] = 'Раздел профиля не найден'
+        data['ok'] = False
+        return JsonResponse(data)
+
+    try:
+        page = get_profile_section_page(request.user, section, request.GET.get('cursor'))
+    except InvalidCursor:
+        data['msg'] = 'Неверный курсор'
+        data['ok'] = False
+        return JsonResponse(data)
+
+    data['rows'] = [get_profile_section_data(section, obj) for obj in page]
+    data['next_cursor'] = page.next_cursor
+    return JsonResponse(data)
+
+
 class CustomLoginView(LoginView):
     form_class = CustomAuthenticationForm
     template_name = 'accounts/registration/signin.html'
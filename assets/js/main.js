@@ -1,62 +1,57 @@
-let timerId = ''
-
-function getSubscribers(url) {
-
-    let subscribers = []
-
-    if (url && url.trim().length > 0) {
-
-        // Создаем JavaScript объект для отправки HTTP запроса
-        let xhr = new XMLHttpRequest()
-
-        // Открываем GET запрос
-        xhr.open("GET", url)
-
-        // Отправляем запрос
-        xhr.send()
-
-        // Ждем ответа от сервера. Метод onloadend срабатывает когда придет ответ
-        xhr.onloadend = function () {
+function showSendingDone() {
+    let alertElement = document.getElementById('alertSendingProcess')
+    if (alertElement) {
+        alertElement.classList.add('d-none')
+    }
+    alertElement = document.getElementById('alertSendingDone')
+    if (alertElement) {
+        alertElement.classList.remove('d-none')
+    }
+}
 
-            // Если статус ответа = 200, значит все OK. Отправленный HTTP успешно вернул ответ
-            if (xhr.status === 200) {
+function waitDispatchProgress(url, progress, polling) {
 
-                let subscribers = []
+    if (progress.finished === true) {
+        showSendingDone()
+        return
+    }
 
-                try {
-                    // Строка формата JSON содержится в реквизите xhr.response - парсим ее
-                    let response = JSON.parse(xhr.response)
-                    updateSubscribers(response.subscribers)
-                    if (response.all_emails_sent === true) {
-                        let alertElement = document.getElementById('alertSendingProcess')
-                        if (alertElement) {
-                            alertElement.classList.add('d-none')
-                        }
-                        alertElement = document.getElementById('alertSendingDone')
-                        if (alertElement) {
-                            alertElement.classList.remove('d-none')
-                        }
-                        if (timerId != '') {
-                            clearInterval(timerId)
-                        }
-                    }
-                } catch (err) {
-                    // Если не удалось распарсить строку ответа, то выводим ошибку
-                    alert(err)
+    // При polling.timeout > 0 (ASGI) это long-poll: сервер отвечает, только когда прогресс отправки изменился
+    // (или по таймауту). При timeout = 0 сервер отвечает сразу, и запросы повторяются раз в polling.interval секунд
+    let params = new URLSearchParams({
+        dispatch: progress.dispatch,
+        processed: progress.processed,
+        since: progress.since,
+        timeout: polling.timeout,
+    })
+    let xhr = new XMLHttpRequest()
+    xhr.open("GET", url + "?" + params.toString())
+    xhr.send()
+
+    xhr.onloadend = function () {
+        if (xhr.status === 200) {
+            try {
+                let response = JSON.parse(xhr.response)
+                if (response.ok !== true) {
+                    alert(response.msg)
+                    return
                 }
-
-            } else {
-                // Если статус ответа не 200, значит при обработке HTTP возникли какие-то ошибки
-                // Ситуации могут быть разные. Выводим ошибку со статусом ответа
-                alert("Ошибка " + xhr.status)
+                // В ответе только подписчики, у которых что-то изменилось
+                updateSubscribers(response.subscribers)
+                if (polling.timeout > 0) {
+                    waitDispatchProgress(url, response, polling)
+                } else {
+                    setTimeout(waitDispatchProgress, polling.interval * 1000, url, response, polling)
+                }
+            } catch (err) {
+                alert(err)
             }
-
+        } else {
+            // Сервер недоступен или перезапускается - повторяем запрос чуть позже
+            setTimeout(waitDispatchProgress, 3000, url, progress, polling)
         }
-
     }
 
-    return subscribers
-
 }
 
 function updateSubscribers(subscribers) {
@@ -106,6 +101,10 @@ function createLetters(url) {
                 try {
                     // Строка формата JSON содержится в реквизите xhr.response - парсим ее
                     let response = JSON.parse(xhr.response)
+                    if (response.ok !== true) {
+                        alert(response.msg)
+                        return
+                    }
                     updateSubscribers(response.subscribers)
                 } catch (err) {
                     // Если не удалось распарсить строку ответа, то выводим ошибку
@@ -124,7 +123,7 @@ function createLetters(url) {
 
 }
 
-function sendLetters(urlSendLetters, urlGetSubscribers) {
+function sendLetters(urlSendLetters, urlDispatchProgress, progressPolling) {
 
     let formLetter = document.getElementById('formLetter')
     if (urlSendLetters && urlSendLetters.trim().length > 0 && formLetter) {
@@ -158,6 +157,14 @@ function sendLetters(urlSendLetters, urlGetSubscribers) {
             if (xhr.status === 200) {
 
                 console.log('Запущена отправка писем')
+                try {
+                    let response = JSON.parse(xhr.response)
+                    if (urlDispatchProgress && urlDispatchProgress.trim().length > 0) {
+                        waitDispatchProgress(urlDispatchProgress, response, progressPolling)
+                    }
+                } catch (err) {
+                    alert(err)
+                }
 
             } else {
                 // Если статус ответа не 200, значит при обработке HTTP возникли какие-то ошибки
@@ -166,10 +173,6 @@ function sendLetters(urlSendLetters, urlGetSubscribers) {
             }
 
         }
-
-        if (urlGetSubscribers && urlGetSubscribers.trim().length > 0) {
-            timerId = setInterval(getSubscribers, 1000, urlGetSubscribers)
-        }
     }
 
 }
@@ -1,5 +1,44 @@
-from django.contrib import admin
+import datetime
+import logging
+
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from main.cache import rebuild_home_snapshot
+
 from . import models
+from .cache import bump_catalog_version
+from .forms import EventActionForm
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkedActionsMixin:
+    """
+    Массовые действия выполняются отдельными UPDATE/DELETE по action_chunk_size строк,
+    каждая порция в своей транзакции: блокировки короткие, а сигналы на каждую строку не вызываются,
+    поэтому счетчики затронутых событий пересчитываются один раз на порцию,
+    а версия каталога и снимок главной страницы обновляются один раз в конце действия.
+    """
+    action_chunk_size = 1000
+
+    @staticmethod
+    def delete_rows(queryset):
+        # Один DELETE без сбора объектов и сигналов post_delete на каждую строку
+        queryset._raw_delete(queryset.db)
+
+    def run_in_chunks(self, request, queryset, description, process_chunk):
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), self.action_chunk_size):
+            chunk = ids[start:start + self.action_chunk_size]
+            with transaction.atomic():
+                process_chunk(chunk)
+            logger.info('%s: обработано %s из %s', description, start + len(chunk), len(ids))
+        bump_catalog_version()
+        rebuild_home_snapshot()
+        self.message_user(request, f'{description}: обработано объектов {len(ids)}', messages.SUCCESS)
 
 
 @admin.register(models.Category)
@@ -7,6 +46,9 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ['id', 'title', 'display_event_count', ]
     list_display_links = ['id', 'title', ]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(event_count=Count('events'))
+
 
 @admin.register(models.Feature)
 class FeatureAdmin(admin.ModelAdmin):
@@ -23,21 +65,8 @@ class FullnessFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         filter_value = self.value()
-        if filter_value:
-            events_id = []
-            if filter_value == models.Event.FULLNESS_FREE:
-                for event in queryset:
-                    if event.get_fullness_legend() == models.Event.FULLNESS_LEGEND_FREE:
-                        events_id.append(event.id)
-            elif filter_value == models.Event.FULLNESS_MIDDLE:
-                for event in queryset:
-                    if event.get_fullness_legend() == models.Event.FULLNESS_LEGEND_MIDDLE:
-                        events_id.append(event.id)
-            elif filter_value == models.Event.FULLNESS_FULL:
-                for event in queryset:
-                    if event.get_fullness_legend() == models.Event.FULLNESS_LEGEND_FULL:
-                        events_id.append(event.id)
-            return queryset.filter(id__in=events_id)
+        if filter_value in dict(models.Event.FULLNESS_VARIANTS):
+            return queryset.with_fullness().filter(fullness=filter_value)
         return queryset
 
 
@@ -52,7 +81,7 @@ class ReviewInstanceInline(admin.TabularInline):
 
 
 @admin.register(models.Event)
-class EventAdmin(admin.ModelAdmin):
+class EventAdmin(ChunkedActionsMixin, admin.ModelAdmin):
     list_display = ['id', 'title', 'category', 'date_start', 'is_private',
                     'participants_number', 'display_enroll_count', 'display_places_left', ]
     list_display_links = ['id', 'title', ]
@@ -63,22 +92,145 @@ class EventAdmin(admin.ModelAdmin):
     readonly_fields = ['display_enroll_count', 'display_places_left', ]
     search_fields = ['title', ]
     inlines = [ReviewInstanceInline]
+    action_form = EventActionForm
+    actions = ['set_category', 'add_features', 'remove_features', 'shift_date_start',
+               'make_private', 'make_public', 'clear_enrolls', ]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_fullness().with_places_left()
+
+    def update_in_chunks(self, request, queryset, description, **values):
+        def process_chunk(chunk):
+            models.Event.objects.filter(pk__in=chunk).update(modified=timezone.now(), **values)
+
+        self.run_in_chunks(request, queryset, description, process_chunk)
+
+    def get_action_value(self, request, name):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid() or form.cleaned_data[name] in (None, ''):
+            label = form.fields[name].label
+            self.message_user(request, f'Для этого действия заполните поле «{label}»', messages.WARNING)
+            return None
+        return form.cleaned_data[name]
+
+    def set_category(self, request, queryset):
+        category = self.get_action_value(request, 'category')
+        if category is not None:
+            self.update_in_chunks(request, queryset, f'Категория «{category}»', category=category)
+
+    set_category.short_description = 'Изменить категорию'
+    set_category.allowed_permissions = ['change']
+
+    def add_features(self, request, queryset):
+        features = self.get_action_value(request, 'features')
+        if not features:
+            return
+        through = models.Event.features.through
+
+        def process_chunk(chunk):
+            through.objects.bulk_create(
+                [through(event_id=event_id, feature=feature) for event_id in chunk for feature in features],
+                ignore_conflicts=True,
+            )
+            models.Event.objects.filter(pk__in=chunk).touch()
+
+        self.run_in_chunks(request, queryset, 'Добавление свойств', process_chunk)
+
+    add_features.short_description = 'Добавить свойства'
+    add_features.allowed_permissions = ['change']
+
+    def remove_features(self, request, queryset):
+        features = self.get_action_value(request, 'features')
+        if not features:
+            return
+        through = models.Event.features.through
+
+        def process_chunk(chunk):
+            through.objects.filter(event_id__in=chunk, feature__in=features).delete()
+            models.Event.objects.filter(pk__in=chunk).touch()
+
+        self.run_in_chunks(request, queryset, 'Удаление свойств', process_chunk)
+
+    remove_features.short_description = 'Убрать свойства'
+    remove_features.allowed_permissions = ['change']
+
+    def shift_date_start(self, request, queryset):
+        days = self.get_action_value(request, 'days')
+        if days is not None:
+            self.update_in_chunks(request, queryset, f'Сдвиг даты начала на {days} дн.',
+                                  date_start=F('date_start') + datetime.timedelta(days=days))
+
+    shift_date_start.short_description = 'Сдвинуть дату начала'
+    shift_date_start.allowed_permissions = ['change']
+
+    def make_private(self, request, queryset):
+        self.update_in_chunks(request, queryset, 'Отмечены частными', is_private=True)
+
+    make_private.short_description = 'Сделать частными'
+    make_private.allowed_permissions = ['change']
+
+    def make_public(self, request, queryset):
+        self.update_in_chunks(request, queryset, 'Отмечены публичными', is_private=False)
+
+    make_public.short_description = 'Сделать публичными'
+    make_public.allowed_permissions = ['change']
+
+    def clear_enrolls(self, request, queryset):
+        def process_chunk(chunk):
+            self.delete_rows(models.Enroll.objects.filter(event_id__in=chunk))
+            models.Event.objects.filter(pk__in=chunk).update(enroll_count=0, modified=timezone.now())
+
+        self.run_in_chunks(request, queryset, 'Удаление записей на события', process_chunk)
+
+    clear_enrolls.short_description = 'Удалить все записи на события'
+    clear_enrolls.allowed_permissions = ['change']
 
 
 @admin.register(models.Enroll)
-class EnrollAdmin(admin.ModelAdmin):
+class EnrollAdmin(ChunkedActionsMixin, admin.ModelAdmin):
     list_display = ['id', 'user', 'event', 'created', ]
     list_display_links = ['id', 'user', 'event', ]
     list_select_related = ['user', 'event', ]
+    actions = ['delete_enrolls', ]
+
+    def delete_enrolls(self, request, queryset):
+        def process_chunk(chunk):
+            enrolls = models.Enroll.objects.filter(pk__in=chunk)
+            event_ids = set(enrolls.values_list('event_id', flat=True))
+            self.delete_rows(enrolls)
+            events = models.Event.objects.filter(pk__in=event_ids)
+            events.refresh_enroll_counts()
+            events.touch()
+
+        self.run_in_chunks(request, queryset, 'Удаление записей', process_chunk)
+
+    delete_enrolls.short_description = 'Удалить выбранные записи (пакетно)'
+    delete_enrolls.allowed_permissions = ['delete']
 
 
 @admin.register(models.Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(ChunkedActionsMixin, admin.ModelAdmin):
     list_display = ['id', 'user', 'event', 'rate', 'created', 'updated', ]
     list_display_links = ['id', 'user', 'event', ]
     list_filter = ['created', 'event', ]
     list_select_related = ['user', 'event', ]
     fields = ['user', 'event', 'rate', 'text', ('created', 'updated'), 'id']
     readonly_fields = ['created', 'updated', 'id', ]
+    actions = ['delete_reviews', ]
+
+    def delete_reviews(self, request, queryset):
+        def process_chunk(chunk):
+            reviews = models.Review.objects.filter(pk__in=chunk)
+            event_ids = set(reviews.values_list('event_id', flat=True))
+            self.delete_rows(reviews)
+            events = models.Event.objects.filter(pk__in=event_ids)
+            events.refresh_ratings()
+            events.touch()
+
+        self.run_in_chunks(request, queryset, 'Удаление отзывов', process_chunk)
+
+    delete_reviews.short_description = 'Удалить выбранные отзывы (пакетно)'
+    delete_reviews.allowed_permissions = ['delete']
 
 
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import models
+
+from events.models import Category, Feature
+
+CATALOG_VERSION_KEY = 'events:catalog_version'
+TAXONOMY_VERSION_KEY = 'events:taxonomy_version'
+USER_VERSION_KEY = 'events:user_version:{}'
+
+Taxonomy = namedtuple('Taxonomy', ['version', 'categories', 'features'])
+
+# Категории и свойства в памяти процесса; актуальность сверяется с версией в общем кэше
+_taxonomy = None
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Начальная версия берется от времени, чтобы после очистки кэша
+        # не вернуться к уже использованным номерам версий
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    # Старые записи не удаляются: они становятся недоступны и истекают по таймауту
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_version(key)
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_taxonomy_version():
+    bump_version(TAXONOMY_VERSION_KEY)
+
+
+def get_user_version(user):
+    # Меняется вместе с избранным пользователя: отметки на общих страницах каталога зависят только от нее
+    if not user.is_authenticated:
+        return None
+    return get_version(USER_VERSION_KEY.format(user.pk))
+
+
+def bump_user_version(user_id):
+    bump_version(USER_VERSION_KEY.format(user_id))
+
+
+def get_taxonomy():
+    global _taxonomy
+    version = get_version(TAXONOMY_VERSION_KEY)
+    taxonomy = _taxonomy
+    if taxonomy is None or taxonomy.version != version:
+        taxonomy = Taxonomy(
+            version=version,
+            categories={category.pk: category for category in Category.objects.order_by('pk')},
+            features={feature.pk: feature for feature in Feature.objects.order_by('pk')},
+        )
+        _taxonomy = taxonomy
+    return taxonomy
+
+
+def get_filter_key_value(value):
+    if isinstance(value, models.Model):
+        return value.pk
+    if isinstance(value, (list, tuple)):
+        return sorted(get_filter_key_value(item) for item in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def get_event_list_cache_key(filters, *extra):
+    # Ключ строится по очищенным данным формы фильтра: посторонние параметры запроса, порядок
+    # и разная запись одних и тех же значений не создают отдельных копий страницы
+    normalized = sorted(
+        (name, get_filter_key_value(value)) for name, value in filters.items()
+        if value is not None and value is not False and value not in ('', [])
+    )
+    digest = hashlib.md5(json.dumps([normalized, extra], ensure_ascii=False).encode()).hexdigest()
+    return f'events:event_list:{digest}'
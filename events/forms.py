@@ -1,5 +1,7 @@
 from django import forms
+from django.contrib.admin.helpers import ActionForm
 
+from events.cache import get_taxonomy
 from events.models import Event, Enroll, Favorite, Category, Feature
 
 
@@ -47,15 +49,9 @@ class EnrollCreationForm(forms.ModelForm):
         for field in self.fields:
             self.fields[field].widget = forms.HiddenInput()
 
-    def clean(self):
-        cleaned_data = super().clean()
-        user = cleaned_data.get('user')
-        event = cleaned_data.get('event')
-
-        if Enroll.objects.filter(user=user, event=event).exists():
-            raise forms.ValidationError(f'Вы уже записаны на это событие. Отменить запись можно в профиле.')
-
-        return cleaned_data
+    def validate_unique(self):
+        # Повторная запись и наличие мест проверяются атомарно в Enroll.create_enroll
+        pass
 
 
 class EventAddToFavoriteForm(forms.ModelForm):
@@ -78,9 +74,18 @@ class EventAddToFavoriteForm(forms.ModelForm):
 
 
 class EventFilterForm(forms.Form):
-    title = forms.CharField(label='Название', required=False)
-    category = forms.ModelChoiceField(label='Категория', queryset=Category.objects.all(), required=False)
-    features = forms.ModelMultipleChoiceField(label='Свойства', queryset=Feature.objects.all(), required=False)
+    ORDERING_NEW = ''
+    ORDERING_DATE_START = 'date_start'
+    ORDERING_RATING = 'rating'
+    ORDERING_CHOICES = (
+        (ORDERING_NEW, 'Сначала новые (при поиске - по релевантности)'),
+        (ORDERING_DATE_START, 'По дате начала'),
+        (ORDERING_RATING, 'По рейтингу'),
+    )
+
+    title = forms.CharField(label='Поиск', required=False)
+    category = forms.TypedChoiceField(label='Категория', coerce=int, empty_value=None, required=False)
+    features = forms.TypedMultipleChoiceField(label='Свойства', coerce=int, required=False)
     date_start = forms.DateTimeField(label='Дата начала',
                                      widget=forms.DateInput(format="%Y-%m-%d", attrs={'type': 'date'}),
                                      required=False)
@@ -93,9 +98,19 @@ class EventFilterForm(forms.Form):
     is_available = forms.BooleanField(label='Есть места',
                                       widget=forms.CheckboxInput(attrs={'type': 'checkbox'}),
                                       required=False)
+    rating_min = forms.FloatField(label='Рейтинг от', min_value=0, max_value=5, required=False)
+    ordering = forms.ChoiceField(label='Сортировка', choices=ORDERING_CHOICES, required=False)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Варианты берутся из кэша категорий и свойств, а не запросом к БД
+        self.taxonomy = get_taxonomy()
+        self.fields['category'].choices = [('', '---------')] + [
+            (category.pk, str(category)) for category in self.taxonomy.categories.values()
+        ]
+        self.fields['features'].choices = [
+            (feature.pk, str(feature)) for feature in self.taxonomy.features.values()
+        ]
         self.fields['category'].widget.attrs.update({'class': 'form-select'})
         self.fields['features'].widget.attrs.update({'class': 'form-select', 'multiple': True})
         self.fields['date_start'].widget.attrs.update({'class': 'form-control'})
@@ -103,3 +118,19 @@ class EventFilterForm(forms.Form):
         self.fields['date_end'].widget.attrs.update({'class': 'form-control'})
         self.fields['is_private'].widget.attrs.update({'class': 'form-check-input'})
         self.fields['is_available'].widget.attrs.update({'class': 'form-check-input'})
+        self.fields['rating_min'].widget.attrs.update({'class': 'form-control', 'step': 0.1})
+        self.fields['ordering'].widget.attrs.update({'class': 'form-select'})
+
+    def clean_category(self):
+        category_id = self.cleaned_data['category']
+        return self.taxonomy.categories[category_id] if category_id else None
+
+    def clean_features(self):
+        # ?features=1&features=1 - один и тот же фильтр (и один ключ кэша)
+        return [self.taxonomy.features[feature_id] for feature_id in dict.fromkeys(self.cleaned_data['features'])]
+
+
+class EventActionForm(ActionForm):
+    category = forms.ModelChoiceField(queryset=Category.objects.all(), required=False, label='Категория')
+    features = forms.ModelMultipleChoiceField(queryset=Feature.objects.all(), required=False, label='Свойства')
+    days = forms.IntegerField(required=False, label='Сдвиг, дней')
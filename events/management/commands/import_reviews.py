@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events.reviews import import_reviews
+
+
+class Command(BaseCommand):
+    help = 'Загружает отзывы из JSON-файла: список объектов с ключами user, event, rate, text'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к JSON-файлу с отзывами')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество отзывов, загружаемых за один пакет')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8') as file:
+                rows = json.load(file)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать файл: {error}')
+        if not isinstance(rows, list):
+            raise CommandError('Файл должен содержать список отзывов')
+
+        batch_size = options['batch_size']
+        total_created = 0
+        for start in range(0, len(rows), batch_size):
+            created, errors = import_reviews(rows[start:start + batch_size])
+            total_created += created
+            for index, msg in errors:
+                self.stderr.write(f'Строка {start + index}: {msg}')
+            self.stdout.write(f'Обработано отзывов: {min(start + batch_size, len(rows))} из {len(rows)}')
+        self.stdout.write(self.style.SUCCESS(f'Добавлено отзывов: {total_created}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from events.models import Event
+from events.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс событий'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild(Event.objects.only('pk', 'title', 'description').iterator())
+        self.stdout.write(self.style.SUCCESS(f'Индекс поиска перестроен ({backend.__class__.__name__})'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохраненные счетчики событий (количество записей и рейтинг)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Количество событий, обновляемых одним запросом')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        event_ids = list(Event.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(event_ids), chunk_size):
+            chunk = event_ids[start:start + chunk_size]
+            Event.objects.filter(pk__in=chunk).refresh_enroll_counts()
+            Event.objects.filter(pk__in=chunk).refresh_ratings()
+            self.stdout.write(f'Обновлено событий: {start + len(chunk)} из {len(event_ids)}')
+        self.stdout.write(self.style.SUCCESS('Счетчики событий пересчитаны'))
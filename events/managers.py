@@ -1,25 +1,89 @@
 from django.db import models
-from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.db.models.functions import Cast, Coalesce
 
 
 class EventQuerySet(models.QuerySet):
-    def with_counts(self):
+    def touch(self):
+        return self.update(modified=timezone.now())
+
+    def refresh_enroll_counts(self):
+        enroll_model = self.model._meta.get_field('enrolls').related_model
+        enroll_counts = enroll_model.objects.filter(
+            event=models.OuterRef('pk'),
+        ).order_by().values('event').annotate(count=models.Count('pk')).values('count')
+        return self.update(enroll_count=Coalesce(models.Subquery(enroll_counts), 0))
+
+    def refresh_ratings(self):
+        review_model = self.model._meta.get_field('reviews').related_model
+        reviews = review_model.objects.filter(
+            event=models.OuterRef('pk'),
+            rate__isnull=False,
+        ).order_by().values('event')
+        return self.update(
+            rating_sum=Coalesce(models.Subquery(reviews.annotate(total=models.Sum('rate')).values('total')), 0),
+            rating_count=Coalesce(models.Subquery(reviews.annotate(count=models.Count('pk')).values('count')), 0),
+        )
+
+    def with_user_flags(self, user):
+        # Для текущего пользователя: одна проверка по индексу (user, event) на событие
+        if not user.is_authenticated:
+            return self.annotate(
+                is_enrolled=models.Value(False, output_field=models.BooleanField()),
+                is_favorite=models.Value(False, output_field=models.BooleanField()),
+            )
+        enroll_model = self.model._meta.get_field('enrolls').related_model
+        favorite_model = self.model._meta.get_field('favorites').related_model
         return self.annotate(
-            count=Coalesce(models.Count('enrolls', distinct=True), 0),
+            is_enrolled=models.Exists(enroll_model.objects.filter(event=models.OuterRef('pk'), user=user)),
+            is_favorite=models.Exists(favorite_model.objects.filter(event=models.OuterRef('pk'), user=user)),
         )
 
-    def event_qs(self):
-        return self.select_related(
-            'category',
-        ).prefetch_related(
-            'enrolls__user',
-            'features',
-            'reviews__user',
-        ).with_counts()
+    def with_fullness(self):
+        # То же, что Event.get_fullness_legend, но в SQL: мест осталось меньше половины <=> 2 * записей > мест
+        return self.annotate(
+            fullness=models.Case(
+                models.When(participants_number=0, then=models.Value('')),
+                models.When(enroll_count=models.F('participants_number'), then=models.Value(self.model.FULLNESS_FULL)),
+                models.When(participants_number__lt=models.F('enroll_count') * 2,
+                            then=models.Value(self.model.FULLNESS_MIDDLE)),
+                default=models.Value(self.model.FULLNESS_FREE),
+                output_field=models.CharField(),
+            ),
+        )
+
+    def with_places_left(self):
+        # То же, что Event.get_places_left, но в SQL: по нему можно сортировать
+        return self.annotate(
+            places_left=models.ExpressionWrapper(
+                models.F('participants_number') - models.F('enroll_count'),
+                output_field=models.IntegerField(),
+            ),
+        )
+
+    def with_rating(self):
+        return self.annotate(
+            rating=models.Case(
+                models.When(rating_count=0, then=models.Value(0.0)),
+                default=Cast('rating_sum', models.FloatField()) / Cast('rating_count', models.FloatField()),
+                output_field=models.FloatField(),
+            ),
+        )
+
+    def with_all_features(self, features):
+        # Один подзапрос GROUP BY / HAVING вместо отдельного JOIN на каждое свойство
+        # повторы в фильтре не должны увеличивать требуемое число свойств
+        features = set(features)
+        event_features = self.model.features.through.objects.filter(
+            feature__in=features,
+        ).order_by().values('event').annotate(
+            feature_count=models.Count('feature', distinct=True),
+        ).filter(feature_count=len(features)).values('event')
+        return self.filter(pk__in=event_features)
 
-    def event_qs1(self):
+    def event_qs(self):
         return self.select_related(
             'category',
         ).prefetch_related(
             'features',
-        ).with_counts()
+        )
@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 10:36
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_enroll_count(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Enroll = apps.get_model('events', 'Enroll')
+    enroll_counts = Enroll.objects.filter(
+        event=models.OuterRef('pk'),
+    ).order_by().values('event').annotate(count=models.Count('pk')).values('count')
+    Event.objects.update(enroll_count=Coalesce(models.Subquery(enroll_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0008_remove_review_enroll'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='enroll_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество записей'),
+        ),
+        migrations.RunPython(fill_enroll_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-18 10:52
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_enrolls(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Enroll = apps.get_model('events', 'Enroll')
+    duplicates = Enroll.objects.values('user', 'event').annotate(
+        first_pk=models.Min('pk'),
+        count=models.Count('pk'),
+    ).filter(count__gt=1)
+    event_ids = set()
+    for item in duplicates:
+        Enroll.objects.filter(user=item['user'], event=item['event']).exclude(pk=item['first_pk']).delete()
+        event_ids.add(item['event'])
+
+    enroll_counts = Enroll.objects.filter(
+        event=models.OuterRef('pk'),
+    ).order_by().values('event').annotate(count=models.Count('pk')).values('count')
+    Event.objects.filter(pk__in=event_ids).update(enroll_count=Coalesce(models.Subquery(enroll_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0009_event_enroll_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_enrolls, migrations.RunPython.noop),
+    ]
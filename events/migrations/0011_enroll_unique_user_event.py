@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0010_remove_duplicate_enrolls'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='enroll',
+            constraint=models.UniqueConstraint(fields=('user', 'event'), name='unique_enroll_user_event'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-18 10:39
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_rating(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Review = apps.get_model('events', 'Review')
+    reviews = Review.objects.filter(
+        event=models.OuterRef('pk'),
+        rate__isnull=False,
+    ).order_by().values('event')
+    Event.objects.update(
+        rating_sum=Coalesce(models.Subquery(reviews.annotate(total=models.Sum('rate')).values('total')), 0),
+        rating_count=Coalesce(models.Subquery(reviews.annotate(count=models.Count('pk')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0011_enroll_unique_user_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating, migrations.RunPython.noop),
+    ]
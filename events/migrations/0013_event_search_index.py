@@ -0,0 +1,104 @@
+# Generated by Django 3.2 on 2026-10-18 11:20
+
+import re
+
+from django.db import migrations
+
+# Копия стеммера из events.search: миграция не должна зависеть от кода приложения, который может измениться
+_WORD = re.compile(r'\w+')
+
+# Стеммер Портера (Snowball) для русского языка
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+_ADJECTIVAL = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))?' + _ADJECTIVE)
+_VERB = re.compile(r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|'
+                   r'ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+_NOUN = re.compile(r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|'
+                   r'ию|ью|ю|ия|ья|я)$')
+_I = re.compile(r'и$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_SOFT_SIGN = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+
+
+def stem_word(word):
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if not match:
+        return word
+    start, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVAL.sub('', rv, 1)
+        if temp == rv:
+            temp = _VERB.sub('', rv, 1)
+            if temp == rv:
+                temp = _NOUN.sub('', rv, 1)
+    rv = _I.sub('', temp, 1)
+
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+
+    temp = _SOFT_SIGN.sub('', rv, 1)
+    if temp == rv:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        rv = _NN.sub('н', rv, 1)
+    else:
+        rv = temp
+    return start + rv
+
+
+def stem_text(text):
+    return ' '.join(stem_word(word) for word in _WORD.findall(text or ''))
+
+
+def create_search_index(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    vendor = schema_editor.connection.vendor
+    events = Event.objects.only('pk', 'title', 'description')
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE events_event_fts USING fts5(title, description, tokenize = 'unicode61')"
+        )
+        for event in events.iterator():
+            schema_editor.execute(
+                'INSERT INTO events_event_fts (rowid, title, description) VALUES (%s, %s, %s)',
+                [event.pk, stem_text(event.title), stem_text(event.description)],
+            )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE events_event_search ('
+            'event_id bigint PRIMARY KEY REFERENCES events_event (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute('CREATE INDEX events_event_search_document ON events_event_search USING gin (document)')
+        schema_editor.execute(
+            'INSERT INTO events_event_search (event_id, document) '
+            "SELECT id, setweight(to_tsvector('russian', title), 'A') || "
+            "setweight(to_tsvector('russian', description), 'B') FROM events_event"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS events_event_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS events_event_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0012_event_rating'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0014_event_modified'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['event', '-id'], name='review_event_id_desc_idx'),
+        ),
+    ]
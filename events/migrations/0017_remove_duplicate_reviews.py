@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 10:50
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_reviews(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Review = apps.get_model('events', 'Review')
+    duplicates = Review.objects.values('user', 'event').annotate(
+        last_pk=models.Max('pk'),
+        count=models.Count('pk'),
+    ).filter(count__gt=1)
+    event_ids = set()
+    for item in duplicates:
+        Review.objects.filter(user=item['user'], event=item['event']).exclude(pk=item['last_pk']).delete()
+        event_ids.add(item['event'])
+
+    reviews = Review.objects.filter(
+        event=models.OuterRef('pk'),
+        rate__isnull=False,
+    ).order_by().values('event')
+    Event.objects.filter(pk__in=event_ids).update(
+        rating_sum=Coalesce(models.Subquery(reviews.annotate(total=models.Sum('rate')).values('total')), 0),
+        rating_count=Coalesce(models.Subquery(reviews.annotate(count=models.Count('pk')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0016_favorite_user_event_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_reviews, migrations.RunPython.noop),
+    ]
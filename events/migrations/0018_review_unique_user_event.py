@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0017_remove_duplicate_reviews'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('user', 'event'), name='unique_review_user_event'),
+        ),
+    ]
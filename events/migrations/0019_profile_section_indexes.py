@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0018_review_unique_user_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enroll',
+            index=models.Index(fields=['user', '-id'], name='enroll_user_id_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-id'], name='favorite_user_id_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', '-id'], name='review_user_id_desc_idx'),
+        ),
+    ]
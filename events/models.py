@@ -1,7 +1,10 @@
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.urls import reverse
+from django.utils import timezone
 
 from events.managers import EventQuerySet
 
@@ -22,9 +25,13 @@ class Category(models.Model):
     title = models.CharField(max_length=90, blank=True, default='', verbose_name='Категория')
 
     def display_event_count(self):
+        # в админке количество приходит аннотацией (CategoryAdmin.get_queryset)
+        if hasattr(self, 'event_count'):
+            return self.event_count
         return self.events.count()
 
     display_event_count.short_description = 'Количество событий'
+    display_event_count.admin_order_field = 'event_count'
 
     class Meta:
         verbose_name = 'Категория'
@@ -56,19 +63,38 @@ class Event(models.Model):
     category = models.ForeignKey(Category, null=True, on_delete=models.CASCADE, related_name='events')
     features = models.ManyToManyField(Feature)
     logo = models.ImageField(blank=True, null=True)
+    enroll_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество записей')
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок')
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок')
+    # меняется и при изменении записей, отзывов, избранного и свойств события (см. events.signals)
+    modified = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Изменено')
+
+    def save(self, *args, **kwargs):
+        self.modified = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'modified'}
+        super().save(*args, **kwargs)
 
     def display_enroll_count(self):
         return self.get_enroll_count()
 
     display_enroll_count.short_description = 'Количество записей'
+    display_enroll_count.admin_order_field = 'enroll_count'
 
     def get_enroll_count(self):
-        return self.enrolls.count()
+        return self.enroll_count
 
     def get_places_left(self):
+        # в админке количество приходит аннотацией (EventQuerySet.with_places_left)
+        if hasattr(self, 'places_left'):
+            return self.places_left
         return int(self.participants_number or 0) - self.get_enroll_count()
 
     def get_fullness_legend(self, **kwargs):
+        # заполненность уже посчитана в запросе (EventQuerySet.with_fullness)
+        if hasattr(self, 'fullness'):
+            return dict(Event.FULLNESS_VARIANTS).get(self.fullness, '')
         legend = ''
         if int(self.participants_number or 0) > 0:
             legend = Event.FULLNESS_LEGEND_FREE
@@ -86,6 +112,7 @@ class Event(models.Model):
         return f'{places_left} ({self.get_fullness_legend(places_left=places_left)})'
 
     display_places_left.short_description = 'Осталось мест'
+    display_places_left.admin_order_field = 'places_left'
 
     class Meta:
         verbose_name = 'Событие'
@@ -97,15 +124,9 @@ class Event(models.Model):
 
     @property
     def rate(self):
-        reviews = self.reviews.all()
-        sum, count = 0, 0
-        for rev in reviews:
-            sum += rev.rate
-            count += 1
-        try:
-            return round(sum / count, 1)
-        except:
+        if not self.rating_count:
             return 0
+        return round(self.rating_sum / self.rating_count, 1)
 
     @property
     def logo_url(self):
@@ -120,20 +141,62 @@ class Event(models.Model):
     def get_delete_url(self):
         return reverse('events:event_delete', args=[str(self.pk)])
 
+    @staticmethod
+    def add_user_flags(events, user):
+        # Отметки «записан»/«в избранном» для уже загруженных событий (страница из кэша) - один запрос по pk
+        flags = {}
+        if user.is_authenticated and events:
+            flags = {
+                pk: (is_enrolled, is_favorite) for pk, is_enrolled, is_favorite in
+                Event.objects.filter(pk__in=[event.pk for event in events]).with_user_flags(user).values_list(
+                    'pk', 'is_enrolled', 'is_favorite',
+                )
+            }
+        for event in events:
+            event.is_enrolled, event.is_favorite = flags.get(event.pk, (False, False))
+
 
 class Enroll(models.Model):
     user = models.ForeignKey(User, blank=True, on_delete=models.CASCADE, related_name='enrolls')
     event = models.ForeignKey(Event, blank=True, on_delete=models.CASCADE, related_name='enrolls')
     created = models.DateTimeField(auto_now_add=True)
 
-
     class Meta:
         verbose_name = 'Запись'
         verbose_name_plural = 'Записи'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'event'], name='unique_enroll_user_event'),
+        ]
+        indexes = [
+            # записи в профиле: WHERE user_id = ... ORDER BY id DESC
+            models.Index(fields=['user', '-id'], name='enroll_user_id_desc_idx'),
+        ]
 
     def __str__(self):
         return f'{self.event} - {self.user}'
 
+    @staticmethod
+    def create_enroll(user, event):
+        # Место занимается условным UPDATE: строка события блокируется до конца транзакции,
+        # поэтому параллельные записи не превышают participants_number,
+        # а повторную запись пользователя отсекает уникальное ограничение
+        with transaction.atomic():
+            seat_taken = Event.objects.filter(
+                pk=event.pk,
+                enroll_count__lt=F('participants_number'),
+            ).update(enroll_count=F('enroll_count') + 1, modified=timezone.now())
+            if not seat_taken:
+                raise ValidationError('Свободных мест на это событие нет.')
+
+            enroll = Enroll(user=user, event=event)
+            enroll.seat_reserved = True
+            try:
+                with transaction.atomic():
+                    enroll.save()
+            except IntegrityError:
+                raise ValidationError('Вы уже записаны на это событие. Отменить запись можно в профиле.')
+        return enroll
+
     def get_delete_url(self):
         return reverse('events:enroll_delete', args=[str(self.pk)])
 
@@ -149,6 +212,15 @@ class Review(models.Model):
     class Meta:
         verbose_name = 'Отзыв'
         verbose_name_plural = 'Отзывы'
+        indexes = [
+            # лента отзывов события: WHERE event_id = ... ORDER BY id DESC
+            models.Index(fields=['event', '-id'], name='review_event_id_desc_idx'),
+            # отзывы в профиле: WHERE user_id = ... ORDER BY id DESC
+            models.Index(fields=['user', '-id'], name='review_user_id_desc_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'event'], name='unique_review_user_event'),
+        ]
 
     def get_delete_url(self):
         return reverse('events:review_delete', args=[str(self.pk)])
@@ -165,6 +237,11 @@ class Favorite(models.Model):
 
     class Meta:
         verbose_name_plural = 'Избранные события '
+        indexes = [
+            models.Index(fields=['user', 'event'], name='favorite_user_event_idx'),
+            # избранное в профиле: WHERE user_id = ... ORDER BY id DESC
+            models.Index(fields=['user', '-id'], name='favorite_user_id_desc_idx'),
+        ]
         verbose_name = 'Избранное событие'
 
     def get_delete_url(self):
@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from events.cache import bump_catalog_version
+from events.models import Event, Review
+from main.cache import rebuild_home_snapshot
+
+
+def parse_reviews(rows):
+    # Проверка полей без запросов к БД: {(user_id, event_id): (номер строки, Review)} и список ошибок
+    errors = []
+    reviews = {}
+    for index, row in enumerate(rows):
+        try:
+            user_id, event_id, rate = int(row['user']), int(row['event']), int(row['rate'])
+        except (KeyError, TypeError, ValueError):
+            errors.append((index, 'Поля user, event и rate обязательны и должны быть числами'))
+            continue
+        text = str(row.get('text') or '').strip()
+        if not text:
+            errors.append((index, 'Оценка и текст отзыва - обязательные поля'))
+        elif not 1 <= rate <= 5:
+            errors.append((index, 'Оценка должна быть от 1 до 5'))
+        elif (user_id, event_id) in reviews:
+            errors.append((index, 'Повторный отзыв в пакете'))
+        else:
+            reviews[(user_id, event_id)] = (index, Review(user_id=user_id, event_id=event_id, rate=rate, text=text))
+    return reviews, errors
+
+
+def create_reviews(reviews):
+    user_ids = {user_id for user_id, _ in reviews}
+    event_ids = {event_id for _, event_id in reviews}
+    errors = []
+    new_reviews = []
+    with transaction.atomic():
+        known_users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        known_events = set(Event.objects.filter(pk__in=event_ids).values_list('pk', flat=True))
+        # уже существующие пары (user, event) - одним запросом на весь пакет
+        existing = set(Review.objects.filter(
+            user_id__in=user_ids,
+            event_id__in=event_ids,
+        ).values_list('user_id', 'event_id'))
+        for (user_id, event_id), (index, review) in reviews.items():
+            if user_id not in known_users:
+                errors.append((index, 'Пользователь не найден'))
+            elif event_id not in known_events:
+                errors.append((index, 'Событие не найдено'))
+            elif (user_id, event_id) in existing:
+                errors.append((index, 'Пользователь уже отправлял отзыв к этому событию'))
+            else:
+                new_reviews.append(review)
+        if new_reviews:
+            # bulk_create не вызывает сигналы, поэтому рейтинг и кэши обновляются здесь
+            Review.objects.bulk_create(new_reviews, batch_size=500)
+            events = Event.objects.filter(pk__in={review.event_id for review in new_reviews})
+            events.refresh_ratings()
+            events.touch()
+            transaction.on_commit(bump_catalog_version)
+            transaction.on_commit(rebuild_home_snapshot)
+    return new_reviews, errors
+
+
+def import_reviews(rows):
+    """
+    Пакетная загрузка отзывов: rows - словари с ключами user, event, rate, text.
+    Возвращает количество добавленных отзывов и список ошибок (номер строки, сообщение).
+    """
+    reviews, errors = parse_reviews(rows)
+    if not reviews:
+        return 0, errors
+    try:
+        new_reviews, create_errors = create_reviews(reviews)
+    except IntegrityError:
+        # параллельная загрузка успела добавить те же пары: пакет откатился, существующие проверяются заново
+        new_reviews, create_errors = create_reviews(reviews)
+    return len(new_reviews), sorted(errors + create_errors)
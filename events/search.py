@@ -0,0 +1,169 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+_WORD = re.compile(r'\w+')
+
+# Стеммер Портера (Snowball) для русского языка
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+_ADJECTIVAL = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))?' + _ADJECTIVE)
+_VERB = re.compile(r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|'
+                   r'ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+_NOUN = re.compile(r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|'
+                   r'ию|ью|ю|ия|ья|я)$')
+_I = re.compile(r'и$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_SOFT_SIGN = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+
+
+def stem_word(word):
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if not match:
+        return word
+    start, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVAL.sub('', rv, 1)
+        if temp == rv:
+            temp = _VERB.sub('', rv, 1)
+            if temp == rv:
+                temp = _NOUN.sub('', rv, 1)
+    rv = _I.sub('', temp, 1)
+
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+
+    temp = _SOFT_SIGN.sub('', rv, 1)
+    if temp == rv:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        rv = _NN.sub('н', rv, 1)
+    else:
+        rv = temp
+    return start + rv
+
+
+def stem_text(text):
+    return ' '.join(stem_word(word) for word in _WORD.findall(text or ''))
+
+
+class SimpleSearchBackend:
+    """Поиск без индекса (LIKE по названию и описанию) для остальных СУБД."""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) | Q(description__icontains=query),
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def index(self, event):
+        pass
+
+    def remove(self, event_id):
+        pass
+
+    def rebuild(self, events):
+        pass
+
+
+class SqliteSearchBackend(SimpleSearchBackend):
+    """
+    Виртуальная таблица FTS5 events_event_fts (rowid = id события).
+    В таблице хранятся основы слов, поэтому словоформы русских слов совпадают.
+    """
+    table = 'events_event_fts'
+
+    def search(self, queryset, query):
+        terms = [f'"{term}"*' for term in stem_text(query).split()]
+        if not terms:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        match = ' '.join(terms)
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match]),
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({self.table}, 2.0, 1.0) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND {self.table}.rowid = events_event.id',
+            [match],
+            output_field=FloatField(),
+        ))
+
+    def index(self, event):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [event.pk])
+            cursor.execute(f'INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)',
+                           [event.pk, stem_text(event.title), stem_text(event.description)])
+
+    def remove(self, event_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [event_id])
+
+    def rebuild(self, events):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)',
+                [(event.pk, stem_text(event.title), stem_text(event.description)) for event in events],
+            )
+
+
+class PostgresSearchBackend(SimpleSearchBackend):
+    """Таблица events_event_search с колонкой tsvector (конфигурация russian) и GIN-индексом."""
+    table = 'events_event_search'
+    document = "setweight(to_tsvector('russian', %s), 'A') || setweight(to_tsvector('russian', %s), 'B')"
+
+    def search(self, queryset, query):
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT event_id FROM {self.table} WHERE document @@ plainto_tsquery('russian', %s)",
+            [query],
+        )).annotate(search_rank=RawSQL(
+            f"SELECT ts_rank(document, plainto_tsquery('russian', %s)) FROM {self.table} "
+            f'WHERE event_id = events_event.id',
+            [query],
+            output_field=FloatField(),
+        ))
+
+    def index(self, event):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.table} (event_id, document) VALUES (%s, {self.document}) '
+                f'ON CONFLICT (event_id) DO UPDATE SET document = EXCLUDED.document',
+                [event.pk, event.title, event.description],
+            )
+
+    def remove(self, event_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE event_id = %s', [event_id])
+
+    def rebuild(self, events):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.executemany(
+                f'INSERT INTO {self.table} (event_id, document) VALUES (%s, {self.document})',
+                [(event.pk, event.title, event.description) for event in events],
+            )
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    backend_path = getattr(settings, 'EVENTS_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return BACKENDS.get(connection.vendor, SimpleSearchBackend)()
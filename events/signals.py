@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_catalog_version, bump_taxonomy_version, bump_user_version
+from .models import Event, Enroll, Review, Category, Feature, Favorite
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Event)
+def index_event(**kwargs):
+    get_search_backend().index(kwargs['instance'])
+
+
+@receiver(post_delete, sender=Event)
+def remove_event_from_index(**kwargs):
+    get_search_backend().remove(kwargs['instance'].pk)
+
+
+# Enroll.create_enroll увеличивает счетчик сам вместе с проверкой свободных мест
+@receiver(post_save, sender=Enroll)
+def increase_enroll_count(**kwargs):
+    if kwargs['created'] and not getattr(kwargs['instance'], 'seat_reserved', False):
+        Event.objects.filter(pk=kwargs['instance'].event_id).update(
+            enroll_count=F('enroll_count') + 1,
+            modified=timezone.now(),
+        )
+
+
+# срабатывает и при каскадном удалении записей (удаление пользователя или события)
+@receiver(post_delete, sender=Enroll)
+def decrease_enroll_count(**kwargs):
+    Event.objects.filter(pk=kwargs['instance'].event_id).update(
+        enroll_count=Greatest(F('enroll_count') - 1, 0),
+        modified=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_event_rating(**kwargs):
+    review = kwargs['instance']
+    if not kwargs['created']:
+        # оценка могла измениться - пересчитываем рейтинг события целиком
+        Event.objects.filter(pk=review.event_id).refresh_ratings()
+        Event.objects.filter(pk=review.event_id).touch()
+    elif review.rate is not None:
+        Event.objects.filter(pk=review.event_id).update(
+            rating_sum=F('rating_sum') + int(review.rate),
+            rating_count=F('rating_count') + 1,
+            modified=timezone.now(),
+        )
+
+
+@receiver(post_delete, sender=Review)
+def remove_event_rating(**kwargs):
+    review = kwargs['instance']
+    if review.rate is not None:
+        Event.objects.filter(pk=review.event_id).update(
+            rating_sum=Greatest(F('rating_sum') - int(review.rate), 0),
+            rating_count=Greatest(F('rating_count') - 1, 0),
+            modified=timezone.now(),
+        )
+
+
+# Кнопка избранного на странице события зависит от пользователя, поэтому ETag страницы тоже должен смениться
+@receiver([post_save, post_delete], sender=Favorite)
+def touch_favorite_event(**kwargs):
+    Event.objects.filter(pk=kwargs['instance'].event_id).touch()
+
+
+@receiver(m2m_changed, sender=Event.features.through)
+def touch_event_features(**kwargs):
+    action = kwargs['action']
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not kwargs['reverse']:
+        events = Event.objects.filter(pk=kwargs['instance'].pk)
+    elif action == 'pre_clear':
+        events = Event.objects.filter(features=kwargs['instance'])
+    else:
+        events = Event.objects.filter(pk__in=kwargs['pk_set'])
+    events.touch()
+
+
+@receiver(post_save, sender=Category)
+def touch_category_events(**kwargs):
+    Event.objects.filter(category=kwargs['instance']).touch()
+
+
+@receiver(post_save, sender=Feature)
+def touch_feature_events(**kwargs):
+    Event.objects.filter(features=kwargs['instance']).touch()
+
+
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=Enroll)
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Feature)
+@receiver(m2m_changed, sender=Event.features.through)
+def invalidate_catalog(**kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+# Избранное не меняет общие страницы каталога, только отметки одного пользователя
+@receiver([post_save, post_delete], sender=Favorite)
+def invalidate_user_flags(**kwargs):
+    user_id = kwargs['instance'].user_id
+    transaction.on_commit(lambda: bump_user_version(user_id))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Feature)
+def invalidate_taxonomy(**kwargs):
+    transaction.on_commit(bump_taxonomy_version)
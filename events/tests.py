@@ -1,3 +1,395 @@
-from django.test import TestCase
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from events.admin import EventAdmin
+from events.forms import EventFilterForm
+from events.models import Event, Enroll, Favorite, Feature, Review
+from events.reviews import import_reviews
+from events.search import get_search_backend
+from events.views import EventListView
+from main.cache import get_home_snapshot
+from utils.pagination import CursorPaginator, InvalidCursor
+from utils.testing import ThreadedTransactionTestCase
+
+
+class EnrollConcurrencyTest(ThreadedTransactionTestCase):
+    participants_number = 50
+    attempts = 300
+    workers = 16
+
+    def setUp(self):
+        self.event = Event.objects.create(
+            title='Популярное событие',
+            date_start=timezone.now(),
+            participants_number=self.participants_number,
+        )
+        User.objects.bulk_create([User(username=f'user{i}') for i in range(self.attempts)])
+        self.users = list(User.objects.order_by('pk'))
+
+    def enroll(self, user):
+        try:
+            Enroll.create_enroll(user, self.event)
+            return True
+        except ValidationError:
+            return False
+        finally:
+            connection.close()
+
+    def run_parallel(self, users):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.enroll, users))
+
+    def test_parallel_enrolls_do_not_exceed_capacity(self):
+        started = time.monotonic()
+        results = self.run_parallel(self.users)
+        elapsed = time.monotonic() - started
+
+        self.event.refresh_from_db()
+        self.assertEqual(results.count(True), self.participants_number)
+        self.assertEqual(Enroll.objects.filter(event=self.event).count(), self.participants_number)
+        self.assertEqual(self.event.enroll_count, self.participants_number)
+        self.assertEqual(self.event.get_places_left(), 0)
+        self.assertLess(elapsed, 30, f'{self.attempts} записей обработаны за {elapsed:.1f} c')
+
+    def test_parallel_enrolls_of_same_user(self):
+        results = self.run_parallel([self.users[0]] * 20)
+
+        self.event.refresh_from_db()
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Enroll.objects.filter(event=self.event).count(), 1)
+        self.assertEqual(self.event.enroll_count, 1)
+
+
+class EventCounterTest(TransactionTestCase):
+    def setUp(self):
+        self.event = Event.objects.create(title='Событие', date_start=timezone.now(), participants_number=2)
+        self.users = [User.objects.create_user(f'user{i}') for i in range(3)]
+
+    def assertEnrollCount(self, count):
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.enroll_count, count)
+        self.assertEqual(self.event.get_places_left(), self.event.participants_number - count)
+
+    def test_enroll_count_follows_enrolls(self):
+        enroll = Enroll.create_enroll(self.users[0], self.event)
+        Enroll.objects.create(user=self.users[1], event=self.event)
+        self.assertEnrollCount(2)
+        with self.assertRaises(ValidationError):
+            Enroll.create_enroll(self.users[2], self.event)
+        self.assertEnrollCount(2)
+
+        enroll.delete()
+        self.assertEnrollCount(1)
+        # каскадное удаление записей вместе с пользователем
+        self.users[1].delete()
+        self.assertEnrollCount(0)
+
+    def test_refresh_event_counters(self):
+        Enroll.create_enroll(self.users[0], self.event)
+        Event.objects.filter(pk=self.event.pk).update(enroll_count=5)
+
+        call_command('refresh_event_counters', stdout=StringIO())
+
+        self.assertEnrollCount(1)
+
+    def assertRating(self, rating_sum, rating_count, rate):
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.rating_sum, self.event.rating_count, self.event.rate),
+                         (rating_sum, rating_count, rate))
+
+    def test_rating_follows_reviews(self):
+        self.client.force_login(self.users[0])
+        response = self.client.post(reverse('api_events:create_review'),
+                                    {'event_id': self.event.pk, 'rate': 4, 'text': 'Хорошо'})
+        self.assertEqual(response.json()['ok'], True)
+        review = Review.objects.create(user=self.users[1], event=self.event, rate=5, text='Отлично')
+        self.assertRating(9, 2, 4.5)
+
+        review.rate = 1
+        review.save()
+        self.assertRating(5, 2, 2.5)
+
+        review.delete()
+        self.assertRating(4, 1, 4)
+
+    def test_refresh_event_ratings(self):
+        Review.objects.create(user=self.users[0], event=self.event, rate=3, text='Нормально')
+        Event.objects.filter(pk=self.event.pk).update(rating_sum=50, rating_count=7)
+
+        call_command('refresh_event_counters', stdout=StringIO())
+
+        self.assertRating(3, 1, 3)
+
+
+class CursorPaginatorTest(TransactionTestCase):
+    def setUp(self):
+        # по три события на одну дату: порядок внутри даты задает pk
+        start = timezone.now()
+        Event.objects.bulk_create([
+            Event(title=f'Событие {i}', date_start=start + datetime.timedelta(days=i // 3), participants_number=10)
+            for i in range(10)
+        ])
+        self.expected = list(Event.objects.order_by('date_start', 'pk').values_list('pk', flat=True))
+        self.paginator = CursorPaginator(Event.objects.all(), 4, ordering=['date_start', 'pk'])
+
+    def test_pages_forward_and_back(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+        self.assertEqual([[event.pk for event in page] for page in pages],
+                         [self.expected[0:4], self.expected[4:8], self.expected[8:10]])
+        self.assertFalse(pages[0].has_previous())
+
+        page = self.paginator.page(pages[-1].previous_cursor)
+        self.assertEqual([event.pk for event in page], self.expected[4:8])
+        page = self.paginator.page(page.previous_cursor)
+        self.assertEqual([event.pk for event in page], self.expected[0:4])
+        self.assertFalse(page.has_previous())
+
+    def test_invalid_cursor(self):
+        for cursor in ['не-курсор', 'e30', self.paginator.encode_cursor(Event.objects.first())[:-2]]:
+            with self.assertRaises(InvalidCursor):
+                self.paginator.page(cursor)
+        self.assertEqual(self.client.get(reverse('events:event_list'), {'cursor': 'e30'}).status_code, 404)
+
+    def test_ordering_must_end_with_pk(self):
+        self.assertFalse(CursorPaginator.is_valid_ordering(Event, ['date_start']))
+        self.assertFalse(CursorPaginator.is_valid_ordering(Event, ['category', 'pk']))
+        self.assertTrue(CursorPaginator.is_valid_ordering(Event, ['-date_start', '-id']))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class EventListCacheTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.events = [
+            Event.objects.create(title=f'Событие {i}', date_start=timezone.now(), participants_number=10)
+            for i in range(3)
+        ]
+        self.first_user = User.objects.create_user('first')
+        self.second_user = User.objects.create_user('second')
+        Favorite.objects.create(user=self.first_user, event=self.events[0])
+
+    def get_flags(self, user):
+        self.client.force_login(user)
+        response = self.client.get(reverse('events:event_list'))
+        flags = {event.pk: (event.is_enrolled, event.is_favorite) for event in response.context['event_objects']}
+        return response, flags
+
+    def test_page_is_shared_and_flags_are_per_user(self):
+        _, flags = self.get_flags(self.first_user)
+        self.assertEqual(flags[self.events[0].pk], (False, True))
+
+        # страница уже в кэше: для второго пользователя запрашиваются только отметки
+        with CaptureQueriesContext(connection) as queries:
+            response, flags = self.get_flags(self.second_user)
+        self.assertEqual(flags[self.events[0].pk], (False, False))
+        self.assertNotIn('data-test="is_favorite"', response.content.decode())
+        event_queries = [query['sql'] for query in queries if 'events_event' in query['sql']]
+        self.assertEqual(len(event_queries), 1, event_queries)
+
+    def test_favorite_changes_only_its_user_etag(self):
+        first_response, _ = self.get_flags(self.first_user)
+        second_response, _ = self.get_flags(self.second_user)
+
+        Favorite.objects.create(user=self.second_user, event=self.events[1])
+
+        response, flags = self.get_flags(self.second_user)
+        self.assertEqual(flags[self.events[1].pk], (False, True))
+        self.assertNotEqual(response['ETag'], second_response['ETag'])
+        self.client.force_login(self.first_user)
+        response = self.client.get(reverse('events:event_list'), HTTP_IF_NONE_MATCH=first_response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_page_keeps_count_and_ignores_extra_params(self):
+        Event.objects.bulk_create([
+            Event(title=f'Событие {i}', date_start=timezone.now(), participants_number=10) for i in range(10)
+        ])
+        url = reverse('events:event_list')
+        self.client.get(url, {'page': 2, 'utm_source': 'mail'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'utm_source': 'site', 'page': 2, 'title': ''})
+        self.assertFalse([query['sql'] for query in queries if 'events_event' in query['sql']])
+        page = response.context['page_obj']
+        self.assertEqual((page.number, page.paginator.count, page.paginator.num_pages), (2, 13, 2))
+        self.assertEqual(len(page.object_list), 4)
+
+    def test_cached_cursor_page(self):
+        Event.objects.bulk_create([
+            Event(title=f'Событие {i}', date_start=timezone.now(), participants_number=10) for i in range(10)
+        ])
+        url = reverse('events:event_list')
+        first_page = self.client.get(url, {'cursor': ''}).context['page_obj']
+
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url, {'cursor': ''}).context['page_obj']
+        self.assertFalse([query['sql'] for query in queries if 'events_event' in query['sql']])
+        self.assertEqual([event.pk for event in page], [event.pk for event in first_page])
+        self.assertEqual(page.next_query, first_page.next_query)
+
+        page = self.client.get(url, {'cursor': page.next_cursor}).context['page_obj']
+        self.assertEqual(len(page), 4)
+        self.assertFalse(page.has_next())
+
+    @mock.patch.object(EventListView, 'cursor_pagination', True)
+    def test_search_pages_in_cursor_mode(self):
+        # сортировка по релевантности и рейтингу не подходит для курсора - страницы обычные, у каждой свой ключ
+        Event.objects.bulk_create([
+            Event(title=f'Концерт {i}', date_start=timezone.now(), participants_number=10) for i in range(12)
+        ])
+        get_search_backend().rebuild(Event.objects.all())
+        url = reverse('events:event_list')
+        # 12 концертов и 3 события из setUp, по 9 на странице
+        for params, second_page_size in [({'title': 'концерт'}, 3), ({'ordering': 'rating'}, 6)]:
+            pages = [self.client.get(url, {**params, 'page': number}).context['page_obj'] for number in [1, 2, 1]]
+            self.assertFalse(getattr(pages[0].paginator, 'is_cursor', False))
+            self.assertEqual([page.number for page in pages], [1, 2, 1])
+            self.assertEqual(len(pages[1]), second_page_size)
+            self.assertFalse({event.pk for event in pages[0]} & {event.pk for event in pages[1]})
+            self.assertEqual([event.pk for event in pages[2]], [event.pk for event in pages[0]])
+
+    def test_etag_follows_cursor_pagination_setting(self):
+        Event.objects.bulk_create([
+            Event(title=f'Событие {i}', date_start=timezone.now(), participants_number=10) for i in range(10)
+        ])
+        url = reverse('events:event_list')
+        etag = self.client.get(url)['ETag']
+
+        # без параметра cursor страница та же, но в другой пагинации - ETag должен смениться
+        with mock.patch.object(EventListView, 'cursor_pagination', True):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['paginator'].is_cursor)
+            etag = response['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_filter_form_is_bound_once_per_request(self):
+        url = reverse('events:event_list')
+        params = {'title': 'событие', 'ordering': 'date_start'}
+        with mock.patch.object(EventFilterForm, 'full_clean', autospec=True,
+                               side_effect=EventFilterForm.full_clean) as full_clean:
+            etag = self.client.get(url, params)['ETag']
+            self.assertEqual(full_clean.call_count, 1)
+            self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(full_clean.call_count, 2)
+
+
+class ReviewImportTest(TransactionTestCase):
+    def test_import_counts_inserted_reviews(self):
+        event = Event.objects.create(title='Событие', date_start=timezone.now(), participants_number=10)
+        first, second, third = [User.objects.create_user(f'user{i}') for i in range(3)]
+        Review.objects.create(user=first, event=event, rate=5, text='Уже есть')
+
+        created, errors = import_reviews([
+            {'user': first.pk, 'event': event.pk, 'rate': 1, 'text': 'Повтор существующего'},
+            {'user': second.pk, 'event': event.pk, 'rate': 3, 'text': 'Новый'},
+            {'user': second.pk, 'event': event.pk, 'rate': 4, 'text': 'Повтор в пакете'},
+            {'user': third.pk, 'event': event.pk, 'rate': 6, 'text': 'Неверная оценка'},
+            {'user': 0, 'event': event.pk, 'rate': 2, 'text': 'Нет пользователя'},
+        ])
+
+        self.assertEqual(created, 1)
+        self.assertEqual([index for index, _ in errors], [0, 2, 3, 4])
+        self.assertEqual(Review.objects.filter(event=event).count(), 2)
+        event.refresh_from_db()
+        self.assertEqual((event.rating_sum, event.rating_count), (8, 2))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class EventAdminTest(TransactionTestCase):
+    def test_sort_by_places_left(self):
+        # у второго события меньше свободных мест, хотя по заполненности оно в той же группе
+        for title, participants_number, enroll_count in [('Первое', 10, 1), ('Второе', 4, 0), ('Третье', 8, 3)]:
+            Event.objects.create(title=title, date_start=timezone.now(), participants_number=participants_number,
+                                 enroll_count=enroll_count)
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+        index = EventAdmin.list_display.index('display_places_left') + 1
+        response = self.client.get(reverse('admin:events_event_changelist'), {'o': index})
+
+        events = response.context['cl'].result_list
+        self.assertEqual([event.title for event in events], ['Второе', 'Третье', 'Первое'])
+        self.assertEqual([event.get_places_left() for event in events], [4, 5, 9])
+
+    def test_bulk_delete_actions_update_counters_and_home_snapshot(self):
+        cache.clear()
+        event = Event.objects.create(title='Событие', date_start=timezone.now(), participants_number=50)
+        users = [User.objects.create_user(f'user{i}') for i in range(30)]
+        Enroll.objects.bulk_create([Enroll(user=user, event=event) for user in users])
+        for index, user in enumerate(users):
+            Review.objects.create(user=user, event=event, rate=3 if index == 0 else 5, text=f'Отзыв {index}')
+        Event.objects.filter(pk=event.pk).refresh_enroll_counts()
+        self.assertEqual(len(get_home_snapshot()['review_list']), 3)
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+        reviews = list(Review.objects.filter(rate=5).values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as review_queries:
+            self.client.post(reverse('admin:events_review_changelist'),
+                             {'action': 'delete_reviews', '_selected_action': reviews})
+        with CaptureQueriesContext(connection) as enroll_queries:
+            self.client.post(reverse('admin:events_event_changelist'),
+                             {'action': 'clear_enrolls', '_selected_action': [event.pk]})
+
+        event.refresh_from_db()
+        self.assertEqual((event.rating_sum, event.rating_count, event.enroll_count), (3, 1, 0))
+        self.assertFalse(Enroll.objects.exists())
+        self.assertEqual([review['text'] for review in get_home_snapshot()['review_list']], ['Отзыв 0'])
+        # число запросов не зависит от количества удаляемых строк
+        for queries in [review_queries, enroll_queries]:
+            self.assertLess(len(queries), 20, [query['sql'] for query in queries])
+            self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 1)
+
+
+class EventSearchTest(TransactionTestCase):
+    def test_search_matches_word_forms_and_ranks_title_higher(self):
+        in_description = Event.objects.create(title='Вечер', description='Концерты под открытым небом',
+                                              date_start=timezone.now(), participants_number=10)
+        in_title = Event.objects.create(title='Концерт группы', description='Живая музыка',
+                                        date_start=timezone.now(), participants_number=10)
+        Event.objects.create(title='Выставка', description='Картины', date_start=timezone.now(), participants_number=10)
+
+        events = get_search_backend().search(Event.objects.all(), 'концерта').order_by('-search_rank', '-pk')
+
+        self.assertEqual(list(events), [in_title, in_description])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class EventFeatureFilterTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.first, self.second = Feature.objects.create(title='Первое'), Feature.objects.create(title='Второе')
+        self.with_first = Event.objects.create(title='С первым', date_start=timezone.now(), participants_number=10)
+        self.with_first.features.set([self.first])
+        self.with_both = Event.objects.create(title='С обоими', date_start=timezone.now(), participants_number=10)
+        self.with_both.features.set([self.first, self.second])
+        Event.objects.create(title='Без свойств', date_start=timezone.now(), participants_number=10)
+
+    def test_repeated_features_do_not_change_result(self):
+        first, second = self.first.pk, self.second.pk
+        cases = [
+            ([first], {self.with_first, self.with_both}),
+            ([first, second], {self.with_both}),
+            ([first, first], {self.with_first, self.with_both}),
+            ([first, second, second], {self.with_both}),
+        ]
+        self.client.force_login(User.objects.create_user('user'))
+        for features, expected in cases:
+            with self.subTest(features=features):
+                self.assertEqual(set(Event.objects.with_all_features(features)), expected)
+                response = self.client.get(reverse('events:event_list'), {'features': features})
+                self.assertEqual(set(response.context['event_objects']), expected)
+                self.assertEqual(response.context['paginator'].count, len(expected))
@@ -5,4 +5,6 @@ app_name = 'api_events'
 
 urlpatterns = [
     path('reviews/create/', views.create_review, name='create_review'),
+    path('reviews/list/', views.list_reviews, name='list_reviews'),
+    path('reviews/batch/', views.create_reviews_batch, name='create_reviews_batch'),
 ]
\ No newline at end of file
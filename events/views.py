@@ -1,17 +1,70 @@
 import datetime
+import hashlib
+import json
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page
+from django.db import IntegrityError
 from django.db.models import Avg, F, Q, DecimalField, Prefetch
 from django.http import JsonResponse, HttpResponseRedirect, Http404, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
-from django.views.decorators.http import require_POST
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_POST
 from django.views.generic import DetailView, ListView, UpdateView, DeleteView, CreateView
 
+from events.cache import (get_catalog_version, get_event_list_cache_key, get_user_version, get_version,
+                          TAXONOMY_VERSION_KEY)
 from events.forms import (EventUpdateForm, EventCreationForm, EnrollCreationForm,
                           EventAddToFavoriteForm, EventFilterForm)
 from events.models import Event, Review, Enroll, Favorite
+from events.reviews import import_reviews
+from events.search import get_search_backend
+from utils.pagination import CursorPage, CursorPaginationMixin, CursorPaginator, InvalidCursor
+
+
+def make_etag(request, *parts):
+    # Сообщения (messages) выводятся на странице один раз, поэтому такую страницу нельзя отдавать через 304
+    if len(messages.get_messages(request)) > 0:
+        return None
+    parts = parts + (request.user.pk,)
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def get_event_modified(request, pk):
+    if not hasattr(request, 'event_modified'):
+        request.event_modified = Event.objects.filter(pk=pk).values_list('modified', flat=True).first()
+    return request.event_modified
+
+
+def event_detail_etag(request, pk):
+    modified = get_event_modified(request, pk)
+    if modified is None:
+        return None
+    return make_etag(request, 'event', pk, modified.isoformat())
+
+
+def event_detail_last_modified(request, pk):
+    return get_event_modified(request, pk)
+
+
+def get_reviews_page(event_id, cursor=None):
+    queryset = Review.objects.filter(event_id=event_id).select_related('user')
+    paginator = CursorPaginator(queryset, settings.EVENTS_REVIEWS_PER_PAGE, ordering=['-pk'])
+    return paginator.page(cursor)
+
+
+def get_review_data(review):
+    return {
+        'user_name': review.user.get_full_name() or review.user.username,
+        'rate': review.rate,
+        'text': review.text,
+        'created': review.created.strftime('%d.%m.%Y'),
+    }
 
 
 class PermissionRequiredMixin:
@@ -26,22 +79,98 @@ class PermissionRequiredMixin:
         return super().post(request, *args, **kwargs)
 
 
-class EventListView(ListView):
+class EventListView(CursorPaginationMixin, ListView):
     model = Event
     template_name = 'events/event_list.html'
     paginate_by = 9
+    cursor_pagination = settings.EVENTS_CURSOR_PAGINATION
     context_object_name = 'event_objects'
 
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.filter_form = EventFilterForm(request.GET)
+
+    def dispatch(self, request, *args, **kwargs):
+        # ETag считает этот же экземпляр view, поэтому форма фильтра связывается и проверяется один раз
+        dispatch = condition(etag_func=lambda request, *args, **kwargs: self.get_etag())(super().dispatch)
+        return dispatch(request, *args, **kwargs)
+
+    def get_etag(self):
+        # Ключ страницы тот же, что у кэша списка, включая выбор курсорной пагинации
+        return make_etag(
+            self.request,
+            'event_list',
+            get_catalog_version(),
+            get_version(TAXONOMY_VERSION_KEY),
+            self.get_cache_key(),
+            get_user_version(self.request.user),
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['heading'] = 'Cобытия'
-        context['filter_form'] = EventFilterForm(self.request.GET)
+        context['filter_form'] = self.filter_form
         return context
 
+    def get_filters(self):
+        return self.filter_form.cleaned_data if self.filter_form.is_valid() else {}
+
+    def get_event_ordering(self):
+        # Сортировка нужна и для ключа кэша до построения queryset: от нее зависит вид пагинации
+        filters = self.get_filters()
+        if filters.get('ordering') == EventFilterForm.ORDERING_DATE_START:
+            return ['date_start', 'pk']
+        if filters.get('ordering') == EventFilterForm.ORDERING_RATING:
+            return ['-rating', '-pk']
+        if filters.get('title'):
+            return ['-search_rank', '-pk']
+        return ['-pk']
+
+    def get_cache_key(self):
+        if self.is_cursor_pagination(self.model, self.get_event_ordering()):
+            position = ('cursor', self.request.GET.get(self.cursor_kwarg) or '')
+        else:
+            position = ('page', self.request.GET.get(self.page_kwarg) or '1')
+        return get_event_list_cache_key(self.get_filters(), *position)
+
+    def paginate_queryset(self, queryset, page_size):
+        # Страница кэшируется под версией каталога: при попадании запросов к БД нет,
+        # а любое изменение событий делает все старые ключи недоступными.
+        # В кэше только строки страницы и количество событий (или курсоры соседних страниц);
+        # страница общая для всех пользователей, отметки «записан»/«в избранном» добавляются после кэша
+        cache_key = self.get_cache_key()
+        version = get_catalog_version()
+        data = cache.get(cache_key, version=version)
+        if data is None:
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            data = {'object_list': list(object_list), 'is_cursor': getattr(paginator, 'is_cursor', False)}
+            if data['is_cursor']:
+                data.update(next_cursor=page.next_cursor, previous_cursor=page.previous_cursor)
+            else:
+                data.update(count=paginator.count, number=page.number)
+            cache.set(cache_key, data, settings.EVENTS_LIST_CACHE_TIMEOUT, version=version)
+        paginator, page = self.get_cached_page(queryset, page_size, data)
+        Event.add_user_flags(page.object_list, self.request.user)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_cached_page(self, queryset, page_size, data):
+        # Пагинатор строится по ленивому queryset, к БД он не обращается
+        if data['is_cursor']:
+            paginator = CursorPaginator(queryset, page_size)
+            page = CursorPage(data['object_list'], paginator, data['next_cursor'], data['previous_cursor'])
+            self.set_cursor_queries(page)
+        else:
+            paginator = self.get_paginator(queryset, page_size, orphans=self.get_paginate_orphans(),
+                                           allow_empty_first_page=self.get_allow_empty())
+            # количество из кэша заменяет Paginator.count, COUNT(*) не выполняется
+            paginator.count = data['count']
+            page = Page(data['object_list'], data['number'], paginator)
+        return paginator, page
+
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.event_qs1()
-        form = EventFilterForm(self.request.GET)
+        queryset = queryset.event_qs().with_rating()
+        form = self.filter_form
         if form.is_valid():
             filter_category = form.cleaned_data['category']
             filter_features = form.cleaned_data['features']
@@ -50,13 +179,13 @@ class EventListView(ListView):
             filter_private = form.cleaned_data['is_private']
             filter_available = form.cleaned_data['is_available']
             filter_title = form.cleaned_data['title']
+            filter_rating_min = form.cleaned_data['rating_min']
             if filter_title:
-                queryset = queryset.filter(title__icontains=filter_title)
+                queryset = get_search_backend().search(queryset, filter_title)
             if filter_category:
                 queryset = queryset.filter(category=filter_category)
             if filter_features:
-                for feature in filter_features:
-                    queryset = queryset.filter(features__in=[feature])
+                queryset = queryset.with_all_features(filter_features)
             if filter_start:
                 queryset = queryset.filter(date_start__gt=filter_start)
             if filter_end:
@@ -64,9 +193,11 @@ class EventListView(ListView):
             if filter_private:
                 queryset = queryset.filter(is_private=filter_private)
             if filter_available:
-                queryset = queryset.filter(count__lt=F('participants_number'))
+                queryset = queryset.filter(enroll_count__lt=F('participants_number'))
+            if filter_rating_min is not None:
+                queryset = queryset.filter(rating__gte=filter_rating_min)
 
-        return queryset.order_by('-pk')
+        return queryset.order_by(*self.get_event_ordering())
 
 
 class EventUpdateView(PermissionRequiredMixin, UpdateView):
@@ -101,6 +232,8 @@ class EventUpdateView(PermissionRequiredMixin, UpdateView):
         return super().form_invalid(form)
 
 
+@method_decorator(condition(etag_func=event_detail_etag, last_modified_func=event_detail_last_modified),
+                  name='dispatch')
 class EventDetailView(DetailView):
     model = Event
     template_name = 'events/event_detail.html'
@@ -114,12 +247,13 @@ class EventDetailView(DetailView):
         context['enroll_form'] = EnrollCreationForm(initial=initial)
         context['favorite_form'] = EventAddToFavoriteForm(initial=initial)
         context['heading'] = 'Cобытие'
+        context['reviews_page'] = get_reviews_page(self.object.pk)
         return context
 
     def get_queryset(self):
         pk = self.kwargs.get(self.pk_url_kwarg)
         queryset = super().get_queryset()
-        queryset = queryset.event_qs().filter(pk=pk)
+        queryset = queryset.event_qs().with_user_flags(self.request.user).filter(pk=pk)
         return queryset
 
 
@@ -162,8 +296,13 @@ class EnrollCreateView(PermissionRequiredMixin, CreateView):
         return self.object.event.get_absolute_url()
 
     def form_valid(self, form):
+        try:
+            self.object = Enroll.create_enroll(self.request.user, form.cleaned_data['event'])
+        except ValidationError as error:
+            form.add_error(None, error)
+            return self.form_invalid(form)
         messages.success(self.request, f'Вы успешно записались на {form.cleaned_data["event"]}')
-        return super().form_valid(form)
+        return HttpResponseRedirect(self.get_success_url())
 
     def form_invalid(self, form):
         messages.error(self.request, form.non_field_errors())
@@ -295,6 +434,70 @@ def create_review(request):
                 updated=data['created']
             )
 
-            new_review.save()
+            try:
+                new_review.save()
+            except IntegrityError:
+                data['msg'] = 'Вы уже отправляли отзыв к этому событию'
+                data['ok'] = False
+
+        return JsonResponse(data)
+
+
+@require_POST
+def create_reviews_batch(request):
+    data = {
+        'ok': True,
+        'msg': '',
+        'created': 0,
+        'errors': [],
+    }
+
+    if not request.user.has_perm('events.add_review'):
+        data['msg'] = 'Недостаточно прав для загрузки отзывов'
+        data['ok'] = False
+        return JsonResponse(data)
+
+    try:
+        rows = json.loads(request.body)['reviews']
+        if not isinstance(rows, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        data['msg'] = 'Ожидается JSON вида {"reviews": [{"user": ..., "event": ..., "rate": ..., "text": ...}]}'
+        data['ok'] = False
+        return JsonResponse(data)
+
+    if len(rows) > settings.EVENTS_REVIEWS_BATCH_LIMIT:
+        data['msg'] = f'В одном запросе не больше {settings.EVENTS_REVIEWS_BATCH_LIMIT} отзывов'
+        data['ok'] = False
+        return JsonResponse(data)
+
+    created, errors = import_reviews(rows)
+    data['created'] = created
+    data['errors'] = [{'index': index, 'msg': msg} for index, msg in errors]
+    return JsonResponse(data)
+
+
+def list_reviews(request):
+    data = {
+        'ok': True,
+        'msg': '',
+        'reviews': [],
+        'next_cursor': None,
+    }
+
+    pk = request.GET.get('event_id', '')
+    if not pk.isdigit():
+        data['msg'] = 'Событие не найдено'
+        data['ok'] = False
+        return JsonResponse(data)
+
+    try:
+        page = get_reviews_page(pk, request.GET.get('cursor'))
+    except InvalidCursor:
+        data['msg'] = 'Неверный курсор'
+        data['ok'] = False
+        return JsonResponse(data)
 
-        return JsonResponse(data)
\ No newline at end of file
+    data['reviews'] = [get_review_data(review) for review in page]
+    data['next_cursor'] = page.next_cursor
+    return JsonResponse(data)
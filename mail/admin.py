@@ -1,15 +1,68 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.http import HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import path, reverse
 
 from . import models
+from .files import import_subscribers
+from .forms import SubscriberImportForm
 
 
 @admin.register(models.Subscriber)
 class SubscriberAdmin(admin.ModelAdmin):
-    list_display = ['id', 'email', ]
-    fields = ['email', ]
+    list_display = ['id', 'email', 'letter_count', 'sent_letter_count', ]
+    fields = ['email', 'letter_count', 'sent_letter_count', ]
+    readonly_fields = ['letter_count', 'sent_letter_count', ]
+    change_list_template = 'admin/mail/subscriber/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='mail_subscriber_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return HttpResponseRedirect(reverse('admin:mail_subscriber_changelist'))
+        form = SubscriberImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            file = form.cleaned_data['file']
+            total = created = invalid = 0
+            try:
+                for total, created, invalid in import_subscribers(file, file.name):
+                    pass
+            except ValueError as error:
+                form.add_error('file', f'Не удалось прочитать файл: {error}')
+            else:
+                self.message_user(request, f'Обработано адресов: {total}, добавлено подписчиков: {created}, '
+                                           f'некорректных адресов: {invalid}', messages.SUCCESS)
+                return HttpResponseRedirect(reverse('admin:mail_subscriber_changelist'))
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Загрузка подписчиков',
+            'form': form,
+        }
+        return render(request, 'admin/mail/subscriber/import.html', context)
 
 
 @admin.register(models.Letter)
 class LetterAdmin(admin.ModelAdmin):
-    list_display = ['id', 'to', 'subject', 'text', 'is_sent', ]
-    fields = ['to', 'subject', 'text', 'is_sent', ]
+    list_display = ['id', 'to', 'campaign', 'is_sent', 'status', 'attempts', ]
+    list_filter = ['status', ]
+    list_select_related = ['to', 'campaign', ]
+    raw_id_fields = ['to', 'campaign', 'dispatch', ]
+    fields = ['to', 'campaign', 'context', 'dispatch', 'is_sent', 'status', 'attempts', 'next_attempt_at',
+              ('locked_by', 'locked_at', 'locked_until'), 'sent_at', ]
+    readonly_fields = ['locked_by', 'locked_at', 'locked_until', 'sent_at', ]
+
+
+@admin.register(models.Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'is_template', 'created', ]
+    readonly_fields = ['created', ]
+
+
+@admin.register(models.Dispatch)
+class DispatchAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created', 'letter_count', 'sent_count', 'failed_count', ]
+    readonly_fields = ['created', 'letter_count', 'sent_count', 'failed_count', ]
@@ -1,8 +1,23 @@
+import asyncio
+import datetime
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.http import require_POST
 
-from mail.models import Subscriber, Letter
+from mail.models import Dispatch, Subscriber, Letter
+from utils.pagination import CursorPaginator, InvalidCursor
+from utils.streaming import StreamingJsonResponse
+
+# Письма пачки получают sent_at до коммита, поэтому изменения ищутся с запасом назад;
+# подписчики возвращаются с полными счетчиками, и повторы безвредны
+PROGRESS_OVERLAP = datetime.timedelta(seconds=10)
 
 
 @require_POST
@@ -10,32 +25,132 @@ def create_letters_view(request):
     emails = request.POST.getlist('email', None)
     subject = request.POST.get('subject', '')
     text = request.POST.get('text', '')
-    new_letters = []
-    if emails and subject and text:
-        new_letters = Letter.create_letters(emails, subject, text)
-    subscribers = Subscriber.get_objects_list()
+    with transaction.atomic():
+        if emails and subject and text:
+            try:
+                Letter.create_letters(emails, subject, text)
+            except ValidationError as error:
+                return JsonResponse({'ok': False, 'msg': ' '.join(error.messages)})
+        # только подписчики из запроса, а не весь список
+        subscribers = Subscriber.get_objects_list(Subscriber.get_by_emails(emails))
 
-    # Демо-режим
-    if not settings.DEBUG:
-        for letter in new_letters:
-            letter.delete()
+        # Демо-режим: созданные письма откатываются вместе с транзакцией
+        if not settings.DEBUG:
+            transaction.set_rollback(True)
 
-    return JsonResponse({'subscribers': subscribers})
+    return JsonResponse({'ok': True, 'subscribers': subscribers})
 
 
 @require_POST
 def send_letters(request):
     emails = request.POST.getlist('email', None)
 
-    for email in emails:
-        subscriber = Subscriber.get_by_email(email)
-        if subscriber:
-            subscriber.send_post(bulk=True)
+    dispatch = Subscriber.send_posts(Subscriber.get_by_emails(emails))
+
+    return JsonResponse({'ok': 'ok', **get_dispatch_progress(dispatch.pk)})
+
 
-    return JsonResponse({'ok': 'ok'})
+def get_subscribers_page(cursor=None):
+    queryset = Subscriber.objects.only(*Subscriber.LIST_FIELDS)
+    paginator = CursorPaginator(queryset, settings.MAIL_SUBSCRIBERS_PER_PAGE, ordering=['pk'])
+    return paginator.page(cursor)
 
 
 def get_subscribers(request):
-    all_emails_sent = not Letter.objects.filter(is_sent=False).exists()
-    return JsonResponse({'subscribers': Subscriber.get_objects_list(),
-                         'all_emails_sent': all_emails_sent})
+    if not request.user.is_authenticated:
+        return JsonResponse({'ok': False, 'msg': 'Недостаточно прав'}, status=403)
+    data = {
+        'ok': True,
+        'msg': '',
+        'subscribers': [],
+        'next_cursor': None,
+        'all_emails_sent': not Letter.objects.filter(is_sent=False).exists(),
+    }
+    try:
+        page = get_subscribers_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        data['msg'] = 'Неверный курсор'
+        data['ok'] = False
+        return JsonResponse(data)
+
+    data['subscribers'] = [{field: getattr(subscriber, field) for field in Subscriber.LIST_FIELDS}
+                           for subscriber in page]
+    data['next_cursor'] = page.next_cursor
+    return JsonResponse(data)
+
+
+def dump_subscribers(request):
+    # Все подписчики одним ответом: строки читаются из базы и кодируются порциями
+    if not request.user.is_authenticated:
+        return JsonResponse({'ok': False, 'msg': 'Недостаточно прав'}, status=403)
+    subscribers = Subscriber.objects.order_by('pk').values(*Subscriber.LIST_FIELDS).iterator(chunk_size=2000)
+    return StreamingJsonResponse({'ok': True}, 'subscribers', subscribers)
+
+
+def get_dispatch_progress(dispatch_id, processed=None, since=None):
+    now = timezone.now()
+    dispatch = Dispatch.objects.filter(pk=dispatch_id).first()
+    if dispatch is None:
+        return None
+    data = {
+        'dispatch': dispatch.pk,
+        'letter_count': dispatch.letter_count,
+        'sent_count': dispatch.sent_count,
+        'failed_count': dispatch.failed_count,
+        'processed': dispatch.processed_count,
+        'finished': dispatch.is_finished,
+        'since': now.isoformat(),
+        'subscribers': [],
+    }
+    if processed is not None and dispatch.processed_count != processed:
+        # только подписчики, чьи письма отправлены с прошлого ответа
+        letters = Letter.objects.filter(dispatch=dispatch, sent_at__isnull=False)
+        if since:
+            letters = letters.filter(sent_at__gte=since - PROGRESS_OVERLAP)
+        data['subscribers'] = Subscriber.get_objects_list(
+            Subscriber.objects.filter(pk__in=letters.values('to')),
+        )
+    return data
+
+
+def get_progress_timeout(request):
+    """
+    Сколько секунд держать запрос прогресса: не больше MAIL_PROGRESS_TIMEOUT и только под ASGI,
+    под WSGI ожидание заняло бы воркер, поэтому ответ приходит сразу
+    """
+    if not isinstance(request, ASGIRequest):
+        return 0
+    try:
+        timeout = float(request.GET.get('timeout', settings.MAIL_PROGRESS_TIMEOUT))
+    except ValueError:
+        timeout = settings.MAIL_PROGRESS_TIMEOUT
+    return max(0, min(timeout, settings.MAIL_PROGRESS_TIMEOUT))
+
+
+async def dispatch_progress(request):
+    """
+    Прогресс отправки писем. С timeout=0 (и всегда под WSGI) ответ приходит сразу, иначе это long-poll:
+    ответ приходит, когда число обработанных писем отличается от processed из запроса, рассылка закончена
+    или истек timeout. Под ASGI ожидание не занимает поток.
+    """
+    # request.user загружается из сессии запросом к БД, поэтому проверка выполняется в потоке
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return JsonResponse({'ok': False, 'msg': 'Недостаточно прав'}, status=403)
+    dispatch_id = request.GET.get('dispatch', '')
+    try:
+        processed = int(request.GET.get('processed', ''))
+    except ValueError:
+        processed = None
+    since = parse_datetime(request.GET.get('since', '') or '')
+    if not dispatch_id.isdigit():
+        return JsonResponse({'ok': False, 'msg': 'Отправка писем не найдена'})
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + get_progress_timeout(request)
+    while True:
+        data = await sync_to_async(get_dispatch_progress)(int(dispatch_id), processed, since)
+        if data is None:
+            return JsonResponse({'ok': False, 'msg': 'Отправка писем не найдена'})
+        if data['processed'] != processed or data['finished'] or loop.time() >= deadline:
+            return JsonResponse({'ok': True, **data})
+        await asyncio.sleep(settings.MAIL_PROGRESS_POLL_INTERVAL)
@@ -0,0 +1,89 @@
+import csv
+import io
+import os
+from itertools import islice
+from zipfile import BadZipFile
+
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from mail.models import Subscriber
+
+IMPORT_EXTENSIONS = ['csv', 'xlsx']
+
+
+class Echo:
+    # "Файл" для csv.writer, который не копит строки, а сразу отдает их в StreamingHttpResponse
+    def write(self, value):
+        return value
+
+
+def iter_rows(file, name):
+    """
+    Построчно читает CSV или XLSX (по расширению name), не загружая файл в память целиком.
+    """
+    extension = os.path.splitext(name)[1].lower().lstrip('.')
+    if extension == 'csv':
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        try:
+            dialect = csv.Sniffer().sniff(text.read(4096), delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        text.seek(0)
+        try:
+            yield from csv.reader(text, dialect)
+        finally:
+            # файл закрывает тот, кто его открыл
+            text.detach()
+    elif extension == 'xlsx':
+        try:
+            workbook = load_workbook(file, read_only=True, data_only=True)
+        except (InvalidFileException, BadZipFile) as error:
+            raise ValueError(error)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield ['' if value is None else str(value) for value in row]
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f'Поддерживаются только файлы {", ".join(IMPORT_EXTENSIONS)}')
+
+
+def iter_emails(rows):
+    # Колонка email ищется по заголовку, без заголовка берется первая колонка
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        return
+    header = [str(value).strip().lower() for value in first_row]
+    if 'email' in header:
+        column = header.index('email')
+    else:
+        column = 0
+        yield first_row[0] if first_row else ''
+    for row in rows:
+        yield row[column] if len(row) > column else ''
+
+
+def import_subscribers(file, name, chunk_size=1000):
+    """
+    Загружает подписчиков порциями по chunk_size адресов. После каждой порции отдает
+    количество прочитанных адресов, добавленных подписчиков и некорректных адресов.
+    """
+    emails = iter_emails(iter_rows(file, name))
+    total = created = invalid = 0
+    while True:
+        chunk = list(islice(emails, chunk_size))
+        if not chunk:
+            break
+        chunk_created, chunk_invalid = Subscriber.import_emails(chunk)
+        total += len(chunk)
+        created += chunk_created
+        invalid += chunk_invalid
+        yield total, created, invalid
+
+
+def iter_export_rows(rows, chunk_size=2000):
+    # iterator() читает строки из базы порциями, без кэша queryset
+    yield Subscriber.LIST_FIELDS
+    yield from rows.iterator(chunk_size=chunk_size)
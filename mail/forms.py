@@ -1,5 +1,7 @@
 from django import forms
+from django.core.validators import FileExtensionValidator
 
+from mail.files import IMPORT_EXTENSIONS
 from mail.models import Subscriber
 
 
@@ -27,3 +29,8 @@ class LetterCreateForm(forms.Form):
         super().__init__(*args, **kwargs)
         self.fields['subject'].widget.attrs.update({'class': 'form-control'})
         self.fields['text'].widget.attrs.update({'class': 'form-control', 'rows': 3})
+
+
+class SubscriberImportForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или XLSX', validators=[FileExtensionValidator(IMPORT_EXTENSIONS)],
+                           help_text='Адреса берутся из колонки email, а без заголовка - из первой колонки')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mail.files import import_subscribers
+
+
+class Command(BaseCommand):
+    help = 'Загружает подписчиков из CSV или XLSX-файла: колонка email или первая колонка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к CSV или XLSX-файлу с адресами')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Количество адресов, загружаемых за один пакет')
+
+    def handle(self, *args, **options):
+        total = created = invalid = 0
+        try:
+            with open(options['path'], 'rb') as file:
+                for total, created, invalid in import_subscribers(file, options['path'], options['chunk_size']):
+                    self.stdout.write(f'Обработано адресов: {total}')
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать файл: {error}')
+        self.stdout.write(f'Некорректных адресов: {invalid}')
+        self.stdout.write(self.style.SUCCESS(f'Добавлено подписчиков: {created}'))
@@ -0,0 +1,75 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+
+from mail.outbox import OutboxSender, claim_letters, get_worker_id, release_letters, release_stale_letters
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди. Можно запускать несколько обработчиков параллельно'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.MAIL_SENDER_BATCH_SIZE,
+                            help='Количество писем, забираемых из очереди за раз')
+        parser.add_argument('--workers', type=int, default=settings.MAIL_SENDER_WORKERS,
+                            help='Количество потоков (SMTP-соединений) обработчика')
+        parser.add_argument('--sleep', type=float, default=settings.MAIL_OUTBOX_POLL_INTERVAL,
+                            help='Пауза (сек), если очередь пуста')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        worker_id = get_worker_id()
+        batch_size = options['batch_size']
+        sender = OutboxSender(workers=options['workers'], batch_size=batch_size)
+        # за один цикл берется по пачке на каждый поток (число потоков ограничено MAIL_MAX_CONNECTIONS)
+        claim_size = batch_size * sender.workers
+        if sender.limiter.is_limited and not sender.limiter.is_cache_shared():
+            warning = ('ВНИМАНИЕ: кэш CACHE_URL локальный для процесса (LocMemCache), ограничения отправки '
+                       'MAIL_RATE_LIMIT, MAIL_DOMAIN_RATE_LIMITS и MAIL_MAX_CONNECTIONS действуют только внутри '
+                       'этого обработчика. Для нескольких обработчиков нужен общий кэш, например Redis')
+            logger.warning(warning)
+            self.stderr.write(warning)
+        self.stdout.write(f'Обработчик {worker_id} запущен')
+        while True:
+            try:
+                released = release_stale_letters()
+                letters = claim_letters(worker_id, claim_size)
+            except OperationalError as error:
+                # например, блокировка базы другим обработчиком - повторим после паузы
+                self.stderr.write(f'Не удалось получить письма из очереди: {error}')
+                time.sleep(options['sleep'])
+                continue
+            if released:
+                self.stdout.write(f'Возвращено в очередь зависших писем: {released}')
+
+            if letters:
+                sender.queue_delays = []
+                started = time.monotonic()
+                try:
+                    sent = sender.send(letters)
+                except Exception as error:
+                    logger.exception('Ошибка отправки пачки писем')
+                    self.stderr.write(f'Ошибка отправки пачки писем: {error}')
+                    continue
+                finally:
+                    # письма пачек, упавших до сохранения результата, сразу возвращаются в очередь
+                    release_letters(worker_id, letters)
+                self.write_stats(sent, len(letters), time.monotonic() - started, sender.queue_delays)
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
+
+    def write_stats(self, sent, total, elapsed, queue_delays):
+        stats = f'Отправлено писем: {sent} из {total} за {elapsed:.1f} с ({sent / max(elapsed, 0.001):.1f} писем/с)'
+        if queue_delays:
+            stats += (f', задержка в очереди: средняя {sum(queue_delays) / len(queue_delays):.1f} с,'
+                      f' максимальная {max(queue_delays):.1f} с')
+        logger.info(stats)
+        self.stdout.write(stats)
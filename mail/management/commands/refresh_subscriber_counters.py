@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from mail.models import Subscriber
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохраненные счетчики писем подписчиков (всего и отправлено)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Количество подписчиков, обновляемых одним запросом')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        subscriber_ids = list(Subscriber.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(subscriber_ids), chunk_size):
+            chunk = subscriber_ids[start:start + chunk_size]
+            Subscriber.objects.filter(pk__in=chunk).refresh_letter_counts()
+            self.stdout.write(f'Обновлено подписчиков: {start + len(chunk)} из {len(subscriber_ids)}')
+        self.stdout.write(self.style.SUCCESS('Счетчики подписчиков пересчитаны'))
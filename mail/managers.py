@@ -1,11 +1,26 @@
+from collections import defaultdict
+
 from django.db import models
-from django.db.models import Q
+from django.db.models import F
 from django.db.models.functions import Coalesce
 
 
 class SubscriberQuerySet(models.QuerySet):
-    def with_counts(self):
-        return self.annotate(
-            letter_count=Coalesce(models.Count('letters'), 0),
-            sent_letter_count=Coalesce(models.Count('letters', Q(letters__is_sent=True)), 0),
+    def refresh_letter_counts(self):
+        letter_model = self.model._meta.get_field('letters').related_model
+        letters = letter_model.objects.filter(to=models.OuterRef('pk')).order_by().values('to')
+        return self.update(
+            letter_count=Coalesce(models.Subquery(letters.annotate(count=models.Count('pk')).values('count')), 0),
+            sent_letter_count=Coalesce(models.Subquery(
+                letters.filter(is_sent=True).annotate(count=models.Count('pk')).values('count'),
+            ), 0),
         )
+
+    def add_to_counter(self, field, counts):
+        # counts: {pk подписчика: изменение}; один UPDATE на каждое различное изменение, обычно +1
+        pks_by_delta = defaultdict(list)
+        for pk, delta in counts.items():
+            if pk is not None and delta:
+                pks_by_delta[delta].append(pk)
+        for delta, pks in pks_by_delta.items():
+            self.filter(pk__in=pks).update(**{field: F(field) + delta})
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='email_lower',
+            field=models.EmailField(editable=False, max_length=254, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 10:52
+
+from django.db import migrations
+
+
+def fill_email_lower(apps, schema_editor):
+    Subscriber = apps.get_model('mail', 'Subscriber')
+    Letter = apps.get_model('mail', 'Letter')
+    # Подписчики с одинаковым email без учета регистра объединяются в первого, письма переносятся к нему
+    kept = {}
+    for subscriber in Subscriber.objects.order_by('pk').iterator():
+        email_lower = subscriber.email.strip().lower() if subscriber.email else None
+        if email_lower is None:
+            continue
+        if email_lower in kept:
+            Letter.objects.filter(to=subscriber).update(to=kept[email_lower])
+            subscriber.delete()
+        else:
+            kept[email_lower] = subscriber.pk
+            Subscriber.objects.filter(pk=subscriber.pk).update(email_lower=email_lower)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0002_subscriber_email_lower'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_email_lower, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2 on 2026-10-18 10:54
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def mark_sent_letters(apps, schema_editor):
+    Letter = apps.get_model('mail', 'Letter')
+    Letter.objects.filter(is_sent=True).update(status='sent')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0004_subscriber_email_lower_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='letter',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки'),
+        ),
+        migrations.AddField(
+            model_name='letter',
+            name='locked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Взято в отправку'),
+        ),
+        migrations.AddField(
+            model_name='letter',
+            name='locked_by',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='Обработчик'),
+        ),
+        migrations.AddField(
+            model_name='letter',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка'),
+        ),
+        migrations.AddField(
+            model_name='letter',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Отправлено в'),
+        ),
+        migrations.AddField(
+            model_name='letter',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Не отправлено'), ('pending', 'В очереди'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Ошибка отправки')], default='draft', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='letter',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='letter_outbox_idx'),
+        ),
+        migrations.RunPython(mark_sent_letters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 10:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0005_letter_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dispatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('letter_count', models.PositiveIntegerField(default=0, verbose_name='Писем')),
+                ('sent_count', models.PositiveIntegerField(default=0, verbose_name='Отправлено')),
+                ('failed_count', models.PositiveIntegerField(default=0, verbose_name='Не отправлено')),
+            ],
+            options={
+                'verbose_name': 'Отправка писем',
+                'verbose_name_plural': 'Отправки писем',
+            },
+        ),
+        migrations.AddField(
+            model_name='letter',
+            name='dispatch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='letters', to='mail.dispatch', verbose_name='Отправка'),
+        ),
+        migrations.AddIndex(
+            model_name='letter',
+            index=models.Index(fields=['dispatch', 'sent_at'], name='letter_dispatch_sent_idx'),
+        ),
+    ]
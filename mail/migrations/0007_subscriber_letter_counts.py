@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 11:00
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_letter_counts(apps, schema_editor):
+    Subscriber = apps.get_model('mail', 'Subscriber')
+    Letter = apps.get_model('mail', 'Letter')
+    letters = Letter.objects.filter(to=models.OuterRef('pk')).order_by().values('to')
+    Subscriber.objects.update(
+        letter_count=Coalesce(models.Subquery(letters.annotate(count=models.Count('pk')).values('count')), 0),
+        sent_letter_count=Coalesce(models.Subquery(
+            letters.filter(is_sent=True).annotate(count=models.Count('pk')).values('count'),
+        ), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0006_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscriber',
+            name='letter_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Писем'),
+        ),
+        migrations.AddField(
+            model_name='subscriber',
+            name='sent_letter_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Отправлено писем'),
+        ),
+        migrations.RunPython(fill_letter_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0007_subscriber_letter_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Campaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('subject', models.CharField(max_length=200, verbose_name='Тема письма')),
+                ('text', models.TextField(verbose_name='Текст письма')),
+                ('is_template', models.BooleanField(default=True, verbose_name='Шаблон Django')),
+            ],
+            options={
+                'verbose_name': 'Рассылка',
+                'verbose_name_plural': 'Рассылки',
+            },
+        ),
+        migrations.AddField(
+            model_name='letter',
+            name='campaign',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='letters', to='mail.campaign', verbose_name='Рассылка'),
+        ),
+        migrations.AddField(
+            model_name='letter',
+            name='context',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Переменные письма'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def move_letter_texts(apps, schema_editor):
+    Campaign = apps.get_model('mail', 'Campaign')
+    Letter = apps.get_model('mail', 'Letter')
+    # Письма с одинаковыми темой и текстом становятся одной рассылкой. Прежние тексты - не шаблоны,
+    # и {{ или {% в них не должны обрабатываться при отправке
+    pairs = Letter.objects.order_by().values_list('subject', 'text').distinct()
+    for subject, text in pairs.iterator():
+        campaign = Campaign.objects.create(subject=subject[:200], text=text, is_template=False)
+        Letter.objects.filter(subject=subject, text=text).update(campaign=campaign)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0008_campaign_templates'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_letter_texts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0009_move_letter_texts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='letter',
+            name='campaign',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='letters', to='mail.campaign', verbose_name='Рассылка'),
+        ),
+        migrations.RemoveField(
+            model_name='letter',
+            name='subject',
+        ),
+        migrations.RemoveField(
+            model_name='letter',
+            name='text',
+        ),
+    ]
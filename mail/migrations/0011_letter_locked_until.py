@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 11:18
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_locked_until(apps, schema_editor):
+    # письма, уже взятые в отправку, освобождаются по прежнему сроку блокировки
+    Letter = apps.get_model('mail', 'Letter')
+    Letter.objects.filter(status='sending', locked_at__isnull=False).update(
+        locked_until=F('locked_at') + datetime.timedelta(seconds=settings.MAIL_OUTBOX_LOCK_TIMEOUT),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0010_letter_campaign_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='letter',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Заблокировано до'),
+        ),
+        migrations.RunPython(set_locked_until, migrations.RunPython.noop),
+    ]
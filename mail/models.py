@@ -1,17 +1,29 @@
-from threading import Thread
-from time import sleep
+from collections import Counter
 
 from django.conf import settings
-from django.core.mail import send_mail
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import models, transaction
+from django.template import TemplateSyntaxError
+from django.utils import timezone
 
 from mail.managers import SubscriberQuerySet
+from mail.rendering import clean_subject, compile_template, render_letter
 
 
 class Subscriber(models.Model):
     email = models.EmailField(null=True)
+    # email в нижнем регистре: уникальный индекс вместо поиска email__iexact
+    email_lower = models.EmailField(null=True, unique=True, editable=False)
+    # счетчики писем обновляются пачками при создании и отправке писем,
+    # пересчитать их заново можно командой refresh_subscriber_counters
+    letter_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Писем')
+    sent_letter_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Отправлено писем')
     objects = SubscriberQuerySet.as_manager()
 
+    # поля подписчика в списке рассылки, API и выгрузке
+    LIST_FIELDS = ['email', 'letter_count', 'sent_letter_count']
+
     def __str__(self):
         return f'{self.email}'
 
@@ -19,88 +31,210 @@ class Subscriber(models.Model):
         verbose_name = 'Подписчик'
         verbose_name_plural = 'Подписчики'
 
+    def save(self, *args, **kwargs):
+        self.email_lower = Subscriber.normalize_email(self.email)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def normalize_email(email):
+        return email.strip().lower() if email else None
+
     @staticmethod
     def get_by_email(email):
-        return Subscriber.objects.filter(email__iexact=email).first()
+        return Subscriber.objects.filter(email_lower=Subscriber.normalize_email(email)).first()
 
     @staticmethod
-    def get_objects_list():
-        qs = Subscriber.objects.with_counts()
-        subscribers = []
-        for item in qs:
-            subscribers.append({
-                'email': item.email,
-                'letter_count': item.letter_count,
-                'sent_letter_count': item.sent_letter_count,
-            })
-        return subscribers
+    def get_by_emails(emails):
+        return Subscriber.objects.filter(email_lower__in={Subscriber.normalize_email(email) for email in emails})
+
+    @staticmethod
+    def import_emails(emails):
+        """
+        Добавляет подписчиков с новыми адресами одним INSERT, уже существующие адреса пропускаются.
+        Возвращает количество добавленных подписчиков и некорректных адресов.
+        """
+        valid_emails = {}
+        invalid = 0
+        for email in emails:
+            email = email.strip() if email else ''
+            if not email:
+                continue
+            try:
+                validate_email(email)
+            except ValidationError:
+                invalid += 1
+                continue
+            valid_emails.setdefault(Subscriber.normalize_email(email), email)
+        existing = set(Subscriber.get_by_emails(valid_emails).values_list('email_lower', flat=True))
+        subscribers = [Subscriber(email=email, email_lower=email_lower)
+                       for email_lower, email in valid_emails.items() if email_lower not in existing]
+        # ignore_conflicts: адрес мог быть добавлен параллельно после проверки
+        Subscriber.objects.bulk_create(subscribers, ignore_conflicts=True)
+        return len(subscribers), invalid
+
+    @staticmethod
+    def get_objects_list(qs=None):
+        qs = Subscriber.objects.all() if qs is None else qs
+        return list(qs.values(*Subscriber.LIST_FIELDS))
 
     def unset_letters(self):
         return self.letters.filter(is_sent=False)
 
-    def send_post(self, bulk=False):
-        # Демо-режим
-        if not settings.DEBUG:
-            letters = list(self.letters.filter(is_sent=True))
-            for letter in letters:
-                letter.is_sent = False
-            Letter.objects.bulk_update(letters, ['is_sent'])
-
-        th_list = []
-        for letter in self.unset_letters():
-            if bulk:
-                th = Thread(target=letter.send)
-                th.start()
-                th_list.append(th)
-            else:
-                letter.send()
-
-        # Демо-режим
+    def send_post(self):
+        return Subscriber.send_posts([self])
+
+    @staticmethod
+    def send_posts(subscribers):
+        # Письма только ставятся в очередь одной рассылкой, отправляет их команда mail_worker
+        statuses = [Letter.STATUS_DRAFT, Letter.STATUS_FAILED]
+        # Демо-режим: отправленные письма можно отправить еще раз
         if not settings.DEBUG:
-            for item in th_list:
-                item.join()
-            th_reset = Thread(target=self.reset_post)
-            th_reset.start()
+            statuses.append(Letter.STATUS_SENT)
+        letters = Letter.objects.filter(
+            to__in=[subscriber.pk for subscriber in subscribers],
+            status__in=statuses,
+        )
+        with transaction.atomic():
+            # письма, отправленные повторно, снова считаются неотправленными
+            unsent_counts = {item['to']: -item['count'] for item in
+                             letters.filter(is_sent=True).order_by().values('to').annotate(count=models.Count('pk'))}
+            Subscriber.objects.add_to_counter('sent_letter_count', unsent_counts)
+            dispatch = Dispatch.objects.create()
+            dispatch.letter_count = letters.update(
+                dispatch=dispatch,
+                status=Letter.STATUS_PENDING,
+                is_sent=False,
+                attempts=0,
+                next_attempt_at=timezone.now(),
+            )
+            dispatch.save(update_fields=['letter_count'])
+        return dispatch
+
+
+class Campaign(models.Model):
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    # тема и текст - шаблоны Django, общие для всех писем рассылки; переменные берутся из Letter.get_context
+    subject = models.CharField(max_length=200, verbose_name='Тема письма')
+    text = models.TextField(verbose_name='Текст письма')
+    # письма, созданные до перехода на шаблоны, отправляются как есть: их текст не шаблон
+    is_template = models.BooleanField(default=True, verbose_name='Шаблон Django')
 
-    def reset_post(self):
-        # Демо-режим
-        sleep(5)
-        letters = list(self.letters.filter(is_sent=True))
-        for letter in letters:
-            letter.is_sent = False
-        Letter.objects.bulk_update(letters, ['is_sent'])
+    def __str__(self):
+        return f'{self.subject} ({self.created:%d.%m.%Y %H:%M})'
+
+    class Meta:
+        verbose_name = 'Рассылка'
+        verbose_name_plural = 'Рассылки'
+
+    def clean(self):
+        if not self.is_template:
+            return
+        try:
+            compile_template(self.subject)
+            compile_template(self.text)
+        except TemplateSyntaxError as error:
+            raise ValidationError(f'Ошибка в шаблоне письма: {error}')
+
+    def render(self, context):
+        if not self.is_template:
+            return clean_subject(self.subject), self.text
+        return render_letter(self.subject, self.text, context)
+
+
+class Dispatch(models.Model):
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    letter_count = models.PositiveIntegerField(default=0, verbose_name='Писем')
+    # счетчики обновляет обработчик очереди (mail.outbox.OutboxSender), по ним опрашивается прогресс
+    sent_count = models.PositiveIntegerField(default=0, verbose_name='Отправлено')
+    failed_count = models.PositiveIntegerField(default=0, verbose_name='Не отправлено')
+
+    def __str__(self):
+        return f'Отправка {self.pk} от {self.created:%d.%m.%Y %H:%M}'
+
+    class Meta:
+        verbose_name = 'Отправка писем'
+        verbose_name_plural = 'Отправки писем'
+
+    @property
+    def processed_count(self):
+        return self.sent_count + self.failed_count
+
+    @property
+    def is_finished(self):
+        return self.processed_count >= self.letter_count
 
 
 class Letter(models.Model):
+    STATUS_DRAFT = 'draft'
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_DRAFT, 'Не отправлено'),
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_SENDING, 'Отправляется'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка отправки'),
+    )
+
     to = models.ForeignKey(Subscriber, null=True, on_delete=models.CASCADE, verbose_name='Получатель',
                            related_name='letters')
-    subject = models.CharField(max_length=200, default='', verbose_name='Тема письма')
-    text = models.TextField(default='', verbose_name='Текст письма')
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, verbose_name='Рассылка', related_name='letters')
+    # переменные шаблона письма для конкретного получателя, дополняют общие из Letter.get_context
+    context = models.JSONField(default=dict, blank=True, verbose_name='Переменные письма')
+    dispatch = models.ForeignKey(Dispatch, null=True, blank=True, on_delete=models.SET_NULL,
+                                 verbose_name='Отправка', related_name='letters')
     is_sent = models.BooleanField(default=False, verbose_name='Отправлено')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_DRAFT, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    locked_by = models.CharField(max_length=100, blank=True, default='', verbose_name='Обработчик')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взято в отправку')
+    # срок блокировки зависит от размера пачки, после него письмо возвращается в очередь
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name='Заблокировано до')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено в')
 
     def __str__(self):
-        return f'{self.to} - {self.subject}'
+        return f'{self.to} - {self.campaign_id}'
+
+    CREATE_BATCH_SIZE = 1000
 
     class Meta:
         verbose_name = 'Письмо'
         verbose_name_plural = 'Письма'
+        indexes = [
+            # выборка очереди обработчиком: WHERE status = 'pending' AND next_attempt_at <= now
+            models.Index(fields=['status', 'next_attempt_at'], name='letter_outbox_idx'),
+            # изменения прогресса отправки: WHERE dispatch_id = ... AND sent_at >= ...
+            models.Index(fields=['dispatch', 'sent_at'], name='letter_dispatch_sent_idx'),
+        ]
 
     @staticmethod
-    def create_letters(emails, subject, text):
+    def create_letters(emails, subject, text, contexts=None):
+        """
+        Создает рассылку с шаблонами subject и text и письма подписчикам из emails.
+        contexts - необязательные переменные шаблона по email получателя.
+        На каждую порцию адресов - один запрос IN по email_lower и один INSERT.
+        """
+        contexts = {Subscriber.normalize_email(email): context for email, context in (contexts or {}).items()}
+        emails = list(dict.fromkeys(Subscriber.normalize_email(email) for email in emails if email))
         new_letters = []
-        for email in emails:
-            to = Subscriber.get_by_email(email)
-            if to:
-                new_letters.append(Letter.objects.create(to=to, subject=subject, text=text))
+        campaign = Campaign(subject=subject, text=text)
+        campaign.full_clean()
+        with transaction.atomic():
+            campaign.save()
+            for start in range(0, len(emails), Letter.CREATE_BATCH_SIZE):
+                chunk = emails[start:start + Letter.CREATE_BATCH_SIZE]
+                subscribers = Subscriber.objects.in_bulk(chunk, field_name='email_lower')
+                letters = [Letter(to=subscribers[email], campaign=campaign, context=contexts.get(email, {}))
+                           for email in chunk if email in subscribers]
+                new_letters.extend(Letter.objects.bulk_create(letters))
+                Subscriber.objects.add_to_counter('letter_count', Counter(letter.to_id for letter in letters))
         return new_letters
 
-    def send(self):
-        send_mail(
-            self.subject,
-            self.text,
-            settings.EMAIL_HOST_USER,
-            [self.to],
-            fail_silently=True,
-         )
-        self.is_sent = True
-        self.save()
\ No newline at end of file
+    def get_context(self):
+        return {'email': self.to.email, **self.context}
+
+    def render(self):
+        return self.campaign.render(self.get_context())
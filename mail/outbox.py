@@ -0,0 +1,126 @@
+import datetime
+import os
+import socket
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from mail.models import Dispatch, Letter, Subscriber
+from mail.sender import LetterSender
+
+
+def get_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def get_lock_timeout(claim_size):
+    # Запас MAIL_OUTBOX_LOCK_TIMEOUT плюс время отправки claim_size писем при самом строгом ограничении скорости
+    rates = [rate for rate in [settings.MAIL_RATE_LIMIT, *settings.MAIL_DOMAIN_RATE_LIMITS.values()] if rate > 0]
+    send_time = claim_size / min(rates) if rates else 0
+    return datetime.timedelta(seconds=settings.MAIL_OUTBOX_LOCK_TIMEOUT + send_time)
+
+
+def claim_letters(worker_id, batch_size):
+    """
+    Забирает из очереди до batch_size писем. Строки блокируются select_for_update(skip_locked=True),
+    поэтому параллельные обработчики получают разные письма; условный UPDATE по статусу
+    защищает и на СУБД без блокировок строк (SQLite).
+    """
+    now = timezone.now()
+    locked_until = now + get_lock_timeout(batch_size)
+    with transaction.atomic():
+        letter_ids = list(Letter.objects.select_for_update(skip_locked=True).filter(
+            status=Letter.STATUS_PENDING,
+            next_attempt_at__lte=now,
+        ).order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:batch_size])
+        Letter.objects.filter(pk__in=letter_ids, status=Letter.STATUS_PENDING).update(
+            status=Letter.STATUS_SENDING,
+            locked_by=worker_id,
+            locked_at=now,
+            locked_until=locked_until,
+        )
+    return list(Letter.objects.filter(
+        pk__in=letter_ids,
+        status=Letter.STATUS_SENDING,
+        locked_by=worker_id,
+    ).select_related('to').prefetch_related('campaign').order_by('pk'))
+
+
+def release_stale_letters():
+    # Письма обработчика, который упал во время отправки, возвращаются в очередь
+    return Letter.objects.filter(status=Letter.STATUS_SENDING, locked_until__lt=timezone.now()).update(
+        status=Letter.STATUS_PENDING,
+        locked_by='',
+        locked_at=None,
+        locked_until=None,
+    )
+
+
+def release_letters(worker_id, letters):
+    """
+    Возвращает в очередь письма обработчика, результат отправки которых не сохранен (ошибка в пачке).
+    Попытка засчитывается, а повтор откладывается, чтобы постоянная ошибка не зацикливала обработчик.
+    """
+    return Letter.objects.filter(
+        pk__in=[letter.pk for letter in letters],
+        status=Letter.STATUS_SENDING,
+        locked_by=worker_id,
+    ).update(
+        status=Letter.STATUS_PENDING,
+        attempts=F('attempts') + 1,
+        next_attempt_at=timezone.now() + get_retry_delay(1),
+        locked_by='',
+        locked_at=None,
+        locked_until=None,
+    )
+
+
+def get_retry_delay(attempts):
+    # Экспоненциальная задержка: 1, 2, 4, ... базовых интервала, но не больше MAIL_OUTBOX_RETRY_MAX_DELAY
+    delay = settings.MAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(delay, settings.MAIL_OUTBOX_RETRY_MAX_DELAY))
+
+
+class OutboxSender(LetterSender):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # задержки в очереди (сек) отправленных писем: от next_attempt_at до отправки
+        self.queue_delays = []
+
+    def save_results(self, letters, sent_letters):
+        now = timezone.now()
+        sent_ids = {letter.pk for letter in sent_letters}
+        for letter in letters:
+            letter.locked_by = ''
+            letter.locked_at = None
+            letter.locked_until = None
+            if letter.pk in sent_ids:
+                with self.lock:
+                    self.queue_delays.append((now - letter.next_attempt_at).total_seconds())
+                letter.status = Letter.STATUS_SENT
+                letter.is_sent = True
+                letter.sent_at = now
+            else:
+                letter.attempts += 1
+                if letter.attempts >= settings.MAIL_OUTBOX_MAX_ATTEMPTS:
+                    letter.status = Letter.STATUS_FAILED
+                else:
+                    letter.status = Letter.STATUS_PENDING
+                    letter.next_attempt_at = now + get_retry_delay(letter.attempts)
+        sent_counts = Counter(letter.dispatch_id for letter in letters if letter.status == Letter.STATUS_SENT)
+        failed_counts = Counter(letter.dispatch_id for letter in letters if letter.status == Letter.STATUS_FAILED)
+        with transaction.atomic():
+            Letter.objects.bulk_update(letters, [
+                'status', 'is_sent', 'sent_at', 'attempts', 'next_attempt_at', 'locked_by', 'locked_at', 'locked_until',
+            ])
+            for dispatch_id in (sent_counts | failed_counts).keys() - {None}:
+                Dispatch.objects.filter(pk=dispatch_id).update(
+                    sent_count=F('sent_count') + sent_counts[dispatch_id],
+                    failed_count=F('failed_count') + failed_counts[dispatch_id],
+                )
+            Subscriber.objects.add_to_counter('sent_letter_count', Counter(
+                letter.to_id for letter in letters if letter.status == Letter.STATUS_SENT
+            ))
@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+RATE_KEY = 'mail:rate'
+CONNECTIONS_KEY = 'mail:connections'
+
+
+class SendRateLimiter:
+    """
+    Ограничения отправки, общие для всех обработчиков через кэш (нужен общий CACHE_URL, например Redis):
+    писем в секунду всего и на домен получателя, а также одновременных SMTP-соединений.
+    Скорость считается счетчиками в окнах по одной секунде - приближение token bucket
+    с запасом токенов на одну секунду.
+    """
+
+    def __init__(self, rate=None, domain_rates=None, max_connections=None):
+        self.rate = settings.MAIL_RATE_LIMIT if rate is None else rate
+        self.domain_rates = settings.MAIL_DOMAIN_RATE_LIMITS if domain_rates is None else domain_rates
+        self.max_connections = settings.MAIL_MAX_CONNECTIONS if max_connections is None else max_connections
+
+    @property
+    def is_limited(self):
+        return bool(self.rate or self.domain_rates or self.max_connections)
+
+    @staticmethod
+    def is_cache_shared():
+        # LocMemCache у каждого процесса свой: ограничения действуют только внутри одного обработчика
+        return not isinstance(caches['default'], LocMemCache)
+
+    @staticmethod
+    def take(key, limit):
+        # Ждет, пока в текущей секунде по ключу отправлено меньше limit писем
+        while True:
+            now = time.time()
+            window_key = f'{key}:{int(now)}'
+            cache.add(window_key, 0, timeout=2)
+            try:
+                count = cache.incr(window_key)
+            except ValueError:
+                continue
+            if count <= limit:
+                return
+            time.sleep(int(now) + 1 - now)
+
+    def wait(self, email):
+        if self.rate:
+            self.take(RATE_KEY, self.rate)
+        domain = email.rsplit('@', 1)[-1].lower()
+        if self.domain_rates.get(domain):
+            self.take(f'{RATE_KEY}:{domain}', self.domain_rates[domain])
+
+    def acquire_connection(self):
+        """
+        Занимает одно из max_connections мест для SMTP-соединения и возвращает его ключ.
+        Место - отдельный ключ кэша, который создается атомарным cache.add и живет MAIL_OUTBOX_LOCK_TIMEOUT:
+        пока соединение работает, срок продлевает refresh_connection, а места упавшего обработчика освобождаются сами.
+        """
+        if not self.max_connections:
+            return None
+        while True:
+            for slot in range(self.max_connections):
+                key = f'{CONNECTIONS_KEY}:{slot}'
+                if cache.add(key, 1, timeout=settings.MAIL_OUTBOX_LOCK_TIMEOUT):
+                    return key
+            time.sleep(0.1)
+
+    @staticmethod
+    def refresh_connection(key):
+        if key:
+            cache.touch(key, timeout=settings.MAIL_OUTBOX_LOCK_TIMEOUT)
+
+    @staticmethod
+    def release_connection(key):
+        if key:
+            cache.delete(key)
@@ -0,0 +1,43 @@
+from functools import lru_cache
+
+from django.template import Context, Engine, Library, defaultfilters, defaulttags
+
+# Скомпилированные шаблоны рассылок; ключ - исходный текст шаблона,
+# поэтому изменение рассылки в админке не оставляет в кэше устаревший шаблон
+TEMPLATE_CACHE_SIZE = 256
+
+# Теги, доступные в шаблонах писем. Без {% load %}, {% include %}, {% extends %}, {% url %} и {% debug %}:
+# текст рассылки пишут пользователи сайта, и шаблон не должен читать файлы и контекст проекта
+LETTER_TAGS = ['if', 'for', 'with', 'firstof', 'cycle', 'now', 'spaceless', 'verbatim', 'comment', 'filter',
+               'templatetag', 'widthratio']
+
+register = Library()
+for name in LETTER_TAGS:
+    register.tag(name, defaulttags.register.tags[name])
+register.filters.update(defaultfilters.register.filters)
+
+
+class LetterEngine(Engine):
+    # встроенные теги и фильтры Django заменены набором для писем из этого модуля
+    default_builtins = ['mail.rendering']
+
+
+# Без загрузчиков шаблонов и подключаемых библиотек; письма - простой текст, поэтому без экранирования HTML
+engine = LetterEngine(loaders=[], libraries={}, autoescape=False)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(source):
+    return engine.from_string(source)
+
+
+def render_letter(subject, text, context):
+    context = Context(context, autoescape=False)
+    subject = compile_template(subject).render(context)
+    text = compile_template(text).render(context)
+    return clean_subject(subject), text
+
+
+def clean_subject(subject):
+    # перевод строки в теме письма недопустим в заголовке
+    return ' '.join(subject.split())
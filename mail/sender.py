@@ -0,0 +1,101 @@
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection
+
+from mail.ratelimit import SendRateLimiter
+
+
+class LetterSender:
+    """
+    Рассылка писем пулом из workers потоков. Каждый поток держит одно SMTP-соединение
+    и отправляет через него пачки по batch_size писем, каждое письмо отдельной командой,
+    чтобы результат был известен для каждого письма; результат сохраняется одним save_results на пачку.
+    Скорость и число соединений ограничивает SendRateLimiter.
+    """
+
+    def __init__(self, workers=None, batch_size=None, limiter=None):
+        self.workers = workers or settings.MAIL_SENDER_WORKERS
+        self.batch_size = batch_size or settings.MAIL_SENDER_BATCH_SIZE
+        self.limiter = limiter or SendRateLimiter()
+        if self.limiter.max_connections:
+            # лишние потоки ждали бы соединения, которые освобождаются только в конце send()
+            self.workers = min(self.workers, self.limiter.max_connections)
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        if not hasattr(self.local, 'connection'):
+            self.local.slot = self.limiter.acquire_connection()
+            self.local.connection = get_connection(fail_silently=False)
+            with self.lock:
+                self.connections.append((self.local.connection, self.local.slot))
+        return self.local.connection
+
+    @staticmethod
+    def build_message(letter, connection):
+        # шаблон рассылки компилируется один раз на процесс (mail.rendering), здесь он только рендерится
+        subject, text = letter.render()
+        return EmailMessage(subject, text, settings.EMAIL_HOST_USER, [letter.to.email], connection=connection)
+
+    @staticmethod
+    def send_message(message):
+        try:
+            return message.send() == 1
+        except (smtplib.SMTPException, OSError):
+            # соединение могло оборваться - следующее письмо откроет новое
+            try:
+                message.connection.close()
+            except (smtplib.SMTPException, OSError):
+                pass
+            return False
+
+    def deliver(self, letters):
+        connection = self.get_connection()
+        try:
+            # соединение остается открытым до конца send(), иначе send_messages открывало бы его на каждое письмо
+            connection.open()
+        except (smtplib.SMTPException, OSError):
+            pass
+        sent_letters = []
+        for letter in letters:
+            # токен берется непосредственно перед письмом, поэтому сервер видит не больше заданной скорости
+            self.limiter.wait(letter.to.email)
+            self.limiter.refresh_connection(self.local.slot)
+            # не отправленные письма остаются неотправленными, и повторяются только они
+            if self.send_message(self.build_message(letter, connection)):
+                sent_letters.append(letter)
+        return sent_letters
+
+    def save_results(self, letters, sent_letters):
+        # результат пачки сохраняет очередь писем (mail.outbox.OutboxSender)
+        raise NotImplementedError
+
+    def send_batch(self, letters):
+        # выполняется в потоке пула: соединение с базой этого потока закрывается после пачки
+        try:
+            sent_letters = self.deliver(letters)
+            self.save_results(letters, sent_letters)
+            return len(sent_letters)
+        finally:
+            db_connection.close()
+
+    def send(self, letters):
+        letters = list(letters)
+        batches = [letters[start:start + self.batch_size] for start in range(0, len(letters), self.batch_size)]
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                return sum(executor.map(self.send_batch, batches))
+        finally:
+            for connection, slot in self.connections:
+                try:
+                    connection.close()
+                except (smtplib.SMTPException, OSError):
+                    pass
+                self.limiter.release_connection(slot)
+            self.connections = []
+
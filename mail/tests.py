@@ -1,3 +1,433 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import smtplib
+import time
+from collections import Counter
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncRequestFactory, RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from mail.api import PROGRESS_OVERLAP, get_dispatch_progress, get_progress_timeout
+from mail.files import import_subscribers
+from mail.models import Campaign, Letter, Subscriber
+from mail.outbox import OutboxSender, claim_letters, get_lock_timeout, release_stale_letters
+from mail.ratelimit import SendRateLimiter
+from utils.streaming import StreamingJsonResponse
+from utils.testing import ThreadedTransactionTestCase
+
+
+class FlakyEmailBackend(EmailBackend):
+    # Письма на адреса fail* не принимаются, остальные попадают в mail.outbox
+    def send_messages(self, messages):
+        for message in messages:
+            message.sent_time = time.time()
+            if message.to[0].startswith('fail'):
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b'rejected')})
+        return super().send_messages(messages)
+
+
+def create_letters(emails, subject='Тема', text='Текст'):
+    Subscriber.objects.bulk_create([Subscriber(email=email, email_lower=email) for email in emails])
+    Letter.create_letters(emails, subject, text)
+    return list(Letter.objects.select_related('to', 'campaign').order_by('pk'))
+
+
+def get_limiter():
+    return SendRateLimiter(rate=0, domain_rates={}, max_connections=0)
+
+
+@override_settings(EMAIL_BACKEND='mail.tests.FlakyEmailBackend')
+class LetterSenderTest(ThreadedTransactionTestCase):
+    def test_failed_letters_are_not_resent_with_batch(self):
+        emails = [f'user{i}@example.com' for i in range(5)] + ['fail1@example.com', 'fail2@example.com']
+        letters = create_letters(emails)
+
+        sent = OutboxSender(workers=2, batch_size=3, limiter=get_limiter()).send(letters)
+
+        self.assertEqual(sent, 5)
+        recipients = [message.to[0] for message in mail.outbox]
+        self.assertCountEqual(recipients, emails[:5])
+        self.assertEqual(set(Letter.objects.filter(is_sent=True).values_list('to__email', flat=True)), set(emails[:5]))
+        self.assertEqual(Subscriber.objects.get(email='user0@example.com').sent_letter_count, 1)
+        self.assertEqual(Subscriber.objects.get(email='fail1@example.com').sent_letter_count, 0)
+
+
+@override_settings(EMAIL_BACKEND='mail.tests.FlakyEmailBackend')
+class SubscriberCounterTest(TransactionTestCase):
+    def get_counts(self, email):
+        subscriber = Subscriber.objects.get(email=email)
+        return subscriber.letter_count, subscriber.sent_letter_count
+
+    def test_counters_follow_letters(self):
+        letters = create_letters(['user1@example.com', 'user2@example.com'])
+        Letter.create_letters(['user1@example.com'], 'Вторая', 'Текст')
+        self.assertEqual(self.get_counts('user1@example.com'), (2, 0))
+
+        OutboxSender(workers=1, batch_size=10, limiter=get_limiter()).send(letters)
+        self.assertEqual(self.get_counts('user1@example.com'), (2, 1))
+        self.assertEqual(self.get_counts('user2@example.com'), (1, 1))
+
+        # повторная отправка снимает отметку об отправке до новой попытки
+        Subscriber.send_posts(Subscriber.objects.filter(email='user2@example.com'))
+        self.assertEqual(self.get_counts('user2@example.com'), (1, 0))
+
+    def test_refresh_subscriber_counters(self):
+        create_letters(['user1@example.com'])
+        Subscriber.objects.update(letter_count=10, sent_letter_count=3)
+
+        call_command('refresh_subscriber_counters', stdout=io.StringIO())
+
+        self.assertEqual(self.get_counts('user1@example.com'), (1, 0))
+
+
+class SubscriberEmailTest(TransactionTestCase):
+    def test_letters_are_created_by_chunks(self):
+        emails = [f'user{i}@example.com' for i in range(5)]
+        Subscriber.objects.bulk_create([Subscriber(email=email, email_lower=email) for email in emails])
+
+        with mock.patch.object(Letter, 'CREATE_BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            letters = Letter.create_letters(
+                ['USER0@example.com', 'user0@example.com', ' user1@example.com'] + emails[2:] + ['unknown@example.com'],
+                'Тема', 'Текст',
+            )
+
+        self.assertCountEqual([letter.to.email for letter in letters], emails)
+        # 5 известных адресов и 1 неизвестный - три порции по 2 адреса: SELECT IN и INSERT на порцию
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')
+                              and 'mail_subscriber' in query['sql']]), 3)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "mail_letter"')]), 3)
+        self.assertEqual(list(Subscriber.objects.values_list('letter_count', flat=True).distinct()), [1])
+
+    def test_create_subscriber_ignores_email_case(self):
+        Subscriber.objects.create(email='user@example.com')
+        self.client.force_login(User.objects.create_user('manager'))
+        url = reverse('mail:subscriber_create')
+
+        self.client.post(url, {'email': 'User@Example.com'})
+        self.assertEqual(Subscriber.objects.count(), 1)
+
+        # проверка формы прошла, но подписчика успели создать параллельно - срабатывает уникальный индекс
+        with mock.patch.object(Subscriber, 'get_by_email', return_value=None):
+            response = self.client.post(url, {'email': 'USER@example.com'})
+        self.assertEqual(Subscriber.objects.count(), 1)
+        self.assertIn('уже с уществует', str(list(get_messages(response.wsgi_request))[0]))
+
+        self.client.post(url, {'email': 'other@example.com'})
+        self.assertCountEqual(Subscriber.objects.values_list('email_lower', flat=True),
+                              ['user@example.com', 'other@example.com'])
+
+    def test_migration_merges_duplicate_subscribers(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('mail', '0002_subscriber_email_lower')])
+        apps = executor.loader.project_state([('mail', '0002_subscriber_email_lower')]).apps
+        old_subscriber = apps.get_model('mail', 'Subscriber')
+        old_letter = apps.get_model('mail', 'Letter')
+        first = old_subscriber.objects.create(email='User@example.com')
+        second = old_subscriber.objects.create(email='user@EXAMPLE.com ')
+        other = old_subscriber.objects.create(email='other@example.com')
+        for subscriber in [first, second, second, other]:
+            old_letter.objects.create(to=subscriber, subject='Тема', text='Текст')
+
+        executor.loader.build_graph()
+        executor.migrate([('mail', '0003_merge_duplicate_subscribers')])
+        apps = executor.loader.project_state([('mail', '0003_merge_duplicate_subscribers')]).apps
+        subscribers = apps.get_model('mail', 'Subscriber').objects.order_by('pk')
+        self.assertEqual([(item.pk, item.email_lower) for item in subscribers],
+                         [(first.pk, 'user@example.com'), (other.pk, 'other@example.com')])
+        letters = apps.get_model('mail', 'Letter').objects.all()
+        self.assertEqual(Counter(letter.to_id for letter in letters), {first.pk: 3, other.pk: 1})
+
+        old_subscriber.objects.all().delete()
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+@override_settings(EMAIL_BACKEND='mail.tests.FlakyEmailBackend')
+class CampaignTemplateTest(TransactionTestCase):
+    def test_clean_rejects_invalid_and_unsafe_templates(self):
+        Campaign(subject='Здравствуйте, {{ name|default:email }}', text='{% if name %}{{ name }}{% endif %}').clean()
+        for text in ['{% if name %}', '{% load static %}', "{% include 'events/event_list.html' %}",
+                     "{% url 'events:event_list' %}", "{% extends '__base.html' %}", '{% debug %}']:
+            with self.subTest(text=text), self.assertRaises(ValidationError):
+                Campaign(subject='Тема', text=text).clean()
+        # письма, созданные до перехода на шаблоны, не проверяются
+        Campaign(subject='Тема', text='{% load static %}', is_template=False).clean()
+
+    def test_letters_are_rendered_with_their_context(self):
+        Subscriber.objects.create(email='user@example.com')
+        Letter.create_letters(['user@example.com'], 'Привет,\n{{ name }}', '{{ email }}: <b>{{ name }}</b>',
+                              contexts={'user@example.com': {'name': 'Анна'}})
+
+        OutboxSender(workers=1, batch_size=10, limiter=get_limiter()).send(
+            Letter.objects.select_related('to', 'campaign'),
+        )
+
+        self.assertEqual(mail.outbox[0].subject, 'Привет, Анна')
+        self.assertEqual(mail.outbox[0].body, 'user@example.com: <b>Анна</b>')
+
+    def test_old_letters_are_sent_verbatim(self):
+        Subscriber.objects.create(email='user@example.com')
+        campaign = Campaign.objects.create(subject='Скидки {{ 10 }}%', text='{% load static %}{{ email }}',
+                                           is_template=False)
+        Letter.objects.create(to=Subscriber.objects.get(), campaign=campaign)
+
+        OutboxSender(workers=1, batch_size=10, limiter=get_limiter()).send(
+            Letter.objects.select_related('to', 'campaign'),
+        )
+
+        self.assertEqual(mail.outbox[0].subject, 'Скидки {{ 10 }}%')
+        self.assertEqual(mail.outbox[0].body, '{% load static %}{{ email }}')
+
+
+@override_settings(EMAIL_BACKEND='mail.tests.FlakyEmailBackend')
+class SendRateLimiterTest(ThreadedTransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_messages_are_spread_over_seconds(self):
+        letters = create_letters([f'user{i}@example.com' for i in range(10)])
+        limiter = SendRateLimiter(rate=4, domain_rates={}, max_connections=0)
+
+        OutboxSender(workers=2, batch_size=10, limiter=limiter).send(letters)
+
+        per_second = Counter(int(message.sent_time) for message in mail.outbox)
+        self.assertEqual(sum(per_second.values()), 10)
+        self.assertLessEqual(max(per_second.values()), 4)
+
+    def test_connection_slots(self):
+        limiter = SendRateLimiter(rate=0, domain_rates={}, max_connections=2)
+        first = limiter.acquire_connection()
+        second = limiter.acquire_connection()
+        self.assertNotEqual(first, second)
+
+        limiter.release_connection(first)
+        self.assertEqual(limiter.acquire_connection(), first)
+
+    @override_settings(MAIL_OUTBOX_LOCK_TIMEOUT=1)
+    def test_refreshed_slot_does_not_expire(self):
+        limiter = SendRateLimiter(rate=0, domain_rates={}, max_connections=1)
+        slot = limiter.acquire_connection()
+        for _ in range(3):
+            time.sleep(0.6)
+            limiter.refresh_connection(slot)
+        self.assertIsNotNone(cache.get(slot))
+
+    def test_worker_warns_about_local_cache(self):
+        for limits, warned in [({}, True), ({'MAIL_RATE_LIMIT': 0, 'MAIL_MAX_CONNECTIONS': 0}, False)]:
+            stderr = io.StringIO()
+            with override_settings(**limits):
+                call_command('mail_worker', once=True, stdout=io.StringIO(), stderr=stderr)
+            self.assertEqual('LocMemCache' in stderr.getvalue(), warned)
+
+
+@override_settings(EMAIL_BACKEND='mail.tests.FlakyEmailBackend')
+class OutboxTest(ThreadedTransactionTestCase):
+    def queue_letters(self, emails):
+        create_letters(emails)
+        return Subscriber.send_posts(Subscriber.objects.all())
+
+    def test_results_are_saved(self):
+        dispatch = self.queue_letters(['user1@example.com', 'user2@example.com', 'fail1@example.com'])
+
+        letters = claim_letters('worker1', 10)
+        self.assertEqual(len(letters), 3)
+        self.assertEqual(claim_letters('worker2', 10), [])
+        OutboxSender(workers=2, batch_size=2, limiter=get_limiter()).send(letters)
+
+        dispatch.refresh_from_db()
+        self.assertEqual((dispatch.sent_count, dispatch.failed_count), (2, 0))
+        failed = Letter.objects.get(to__email='fail1@example.com')
+        self.assertEqual((failed.status, failed.attempts, failed.locked_by), (Letter.STATUS_PENDING, 1, ''))
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+
+    def test_letters_are_released_when_batch_fails(self):
+        self.queue_letters(['user1@example.com', 'broken@example.com'])
+
+        def deliver(sender, letters):
+            if any(letter.to.email.startswith('broken') for letter in letters):
+                raise RuntimeError('SMTP недоступен')
+            return letters
+
+        with mock.patch.object(OutboxSender, 'deliver', deliver), \
+                self.assertLogs('mail.management.commands.mail_worker', 'ERROR'):
+            call_command('mail_worker', once=True, batch_size=1, workers=2, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(Letter.objects.get(to__email='user1@example.com').status, Letter.STATUS_SENT)
+        broken = Letter.objects.get(to__email='broken@example.com')
+        self.assertEqual((broken.status, broken.attempts, broken.locked_by), (Letter.STATUS_PENDING, 1, ''))
+
+    def test_stale_letters_are_released(self):
+        self.queue_letters(['user1@example.com', 'user2@example.com'])
+        claim_letters('worker1', 10)
+        self.assertEqual(release_stale_letters(), 0)
+
+        Letter.objects.update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(release_stale_letters(), 2)
+        self.assertEqual(len(claim_letters('worker2', 10)), 2)
+
+    @override_settings(MAIL_OUTBOX_LOCK_TIMEOUT=300, MAIL_RATE_LIMIT=10, MAIL_DOMAIN_RATE_LIMITS={'mail.ru': 5})
+    def test_lock_timeout_covers_claim(self):
+        self.assertEqual(get_lock_timeout(100), datetime.timedelta(seconds=320))
+
+
+class SubscriberFileTest(TransactionTestCase):
+    def import_file(self, content, name, chunk_size=2):
+        return list(import_subscribers(io.BytesIO(content), name, chunk_size))[-1]
+
+    def test_import_csv(self):
+        Subscriber.objects.create(email='Old@example.com', email_lower='old@example.com')
+        content = '\ufeffname;email\nПервый;user1@example.com\nВторой;USER1@example.com\nТретий;not-an-email\n' \
+                  'Старый;old@EXAMPLE.com\nЧетвертый;user2@example.com\nПустой;\n'
+
+        total, created, invalid = self.import_file(content.encode(), 'subscribers.csv')
+
+        self.assertEqual((total, created, invalid), (6, 2, 1))
+        self.assertCountEqual(Subscriber.objects.values_list('email_lower', flat=True),
+                              ['old@example.com', 'user1@example.com', 'user2@example.com'])
+
+    def test_import_xlsx_without_header(self):
+        workbook = Workbook()
+        for email in ['user1@example.com', 'user2@example.com', None, 'user3@example.com']:
+            workbook.active.append([email])
+        file = io.BytesIO()
+        workbook.save(file)
+
+        total, created, invalid = self.import_file(file.getvalue(), 'subscribers.xlsx')
+
+        self.assertEqual((total, created, invalid), (4, 3, 0))
+
+    def test_unsupported_file(self):
+        with self.assertRaises(ValueError):
+            self.import_file(b'user@example.com', 'subscribers.txt')
+        with self.assertRaises(ValueError):
+            self.import_file(b'not a zip', 'subscribers.xlsx')
+
+    def test_export_csv(self):
+        create_letters(['user1@example.com', 'user2@example.com'])
+        self.client.force_login(User.objects.create_user('manager'))
+
+        response = self.client.get(reverse('mail:subscriber_export'))
+
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows, [
+            Subscriber.LIST_FIELDS,
+            ['user1@example.com', '1', '0'],
+            ['user2@example.com', '1', '0'],
+        ])
+
+
+class SubscriberApiTest(TransactionTestCase):
+    def setUp(self):
+        emails = [f'user{i}@example.com' for i in range(5)]
+        Subscriber.objects.bulk_create([Subscriber(email=email, email_lower=email) for email in emails])
+
+    def test_anonymous_user_is_forbidden(self):
+        for name in ['api_mail:get_subscribers', 'api_mail:dump_subscribers', 'api_mail:dispatch_progress']:
+            response = self.client.get(reverse(name), {'dispatch': 1, 'processed': 0})
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(response.json()['ok'], False)
+
+    @override_settings(MAIL_SUBSCRIBERS_PER_PAGE=2)
+    def test_subscribers_are_paged_by_cursor(self):
+        self.client.force_login(User.objects.create_user('manager'))
+        emails = []
+        cursor = ''
+        while cursor is not None:
+            data = self.client.get(reverse('api_mail:get_subscribers'), {'cursor': cursor}).json()
+            self.assertLessEqual(len(data['subscribers']), 2)
+            emails += [subscriber['email'] for subscriber in data['subscribers']]
+            cursor = data['next_cursor']
+        self.assertEqual(emails, [f'user{i}@example.com' for i in range(5)])
+
+    def test_dump_is_streamed_as_one_json_document(self):
+        self.client.force_login(User.objects.create_user('manager'))
+        response = self.client.get(reverse('api_mail:dump_subscribers'))
+
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['ok'], True)
+        self.assertEqual([subscriber['email'] for subscriber in data['subscribers']],
+                         [f'user{i}@example.com' for i in range(5)])
+        self.assertEqual(set(data['subscribers'][0]), set(Subscriber.LIST_FIELDS))
+
+    def test_streaming_json_chunks(self):
+        for count in [0, 1, 4, 5]:
+            chunks = StreamingJsonResponse.iter_json({'ok': True}, 'items', range(count), DjangoJSONEncoder(), 2)
+            self.assertEqual(json.loads(''.join(chunks)), {'ok': True, 'items': list(range(count))})
+
+
+class DispatchProgressTest(TransactionTestCase):
+    def setUp(self):
+        self.letters = create_letters([f'user{i}@example.com' for i in range(3)])
+        self.dispatch = Subscriber.send_posts(Subscriber.objects.all())
+
+    def mark_sent(self, letters, sent_at):
+        Letter.objects.filter(pk__in=[letter.pk for letter in letters]).update(
+            status=Letter.STATUS_SENT, is_sent=True, sent_at=sent_at,
+        )
+        self.dispatch.sent_count += len(letters)
+        self.dispatch.save(update_fields=['sent_count'])
+
+    def get_emails(self, data):
+        return sorted(subscriber['email'] for subscriber in data['subscribers'])
+
+    def test_subscribers_only_when_processed_changed(self):
+        self.mark_sent(self.letters[:1], timezone.now())
+
+        data = get_dispatch_progress(self.dispatch.pk, processed=1)
+        self.assertEqual(data['processed'], 1)
+        self.assertEqual(data['finished'], False)
+        self.assertEqual(data['subscribers'], [])
+
+        data = get_dispatch_progress(self.dispatch.pk, processed=0)
+        self.assertEqual(self.get_emails(data), ['user0@example.com'])
+
+        self.assertEqual(get_dispatch_progress(self.dispatch.pk)['subscribers'], [])
+
+    def test_since_skips_letters_sent_before_overlap(self):
+        now = timezone.now()
+        self.mark_sent(self.letters[:1], now - PROGRESS_OVERLAP - datetime.timedelta(seconds=5))
+        self.mark_sent(self.letters[1:], now - PROGRESS_OVERLAP + datetime.timedelta(seconds=5))
+
+        data = get_dispatch_progress(self.dispatch.pk, processed=1, since=now)
+        self.assertEqual(self.get_emails(data), ['user1@example.com', 'user2@example.com'])
+        self.assertEqual(data['finished'], True)
+
+        data = get_dispatch_progress(self.dispatch.pk, processed=1)
+        self.assertEqual(len(data['subscribers']), 3)
+
+    @override_settings(MAIL_PROGRESS_TIMEOUT=5)
+    def test_response_is_immediate_without_asgi(self):
+        self.client.force_login(User.objects.create_user('manager'))
+        started = time.monotonic()
+        for timeout in [0, 5]:
+            response = self.client.get(reverse('api_mail:dispatch_progress'), {
+                'dispatch': self.dispatch.pk, 'processed': 0, 'timeout': timeout,
+            })
+            self.assertEqual(response.json()['processed'], 0)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_timeout_is_capped(self):
+        factory = AsyncRequestFactory()
+        with override_settings(MAIL_PROGRESS_TIMEOUT=5):
+            self.assertEqual(get_progress_timeout(factory.get('/?timeout=0')), 0)
+            self.assertEqual(get_progress_timeout(factory.get('/?timeout=60')), 5)
+            self.assertEqual(get_progress_timeout(factory.get('/')), 5)
+            self.assertEqual(get_progress_timeout(RequestFactory().get('/', {'timeout': 5})), 0)
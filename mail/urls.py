@@ -6,5 +6,6 @@ app_name = 'mail'
 
 urlpatterns = [
     path('subscriber/create/', views.SubscriberCreateView.as_view(), name='subscriber_create'),
-    path('subscriber/list/', views.SubscriberListView.as_view(), name='subscriber_list')
+    path('subscriber/list/', views.SubscriberListView.as_view(), name='subscriber_list'),
+    path('subscriber/export/', views.SubscriberExportView.as_view(), name='subscriber_export'),
 ]
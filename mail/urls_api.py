@@ -7,4 +7,6 @@ urlpatterns = [
     path('create-letters/', api.create_letters_view, name='create_letters'),
     path('send-letters/', api.send_letters, name='send_letters'),
     path('get-subscribers/', api.get_subscribers, name='get_subscribers'),
+    path('dump-subscribers/', api.dump_subscribers, name='dump_subscribers'),
+    path('dispatch-progress/', api.dispatch_progress, name='dispatch_progress'),
 ]
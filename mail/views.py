@@ -1,11 +1,18 @@
+import csv
+
+from django.conf import settings
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.db import IntegrityError
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.views.generic import ListView, CreateView
 
+from mail.api import get_progress_timeout
+from mail.files import Echo, iter_export_rows
 from mail.forms import SubscriberCreateForm, LetterCreateForm
 from mail.models import Subscriber
 from events.views import PermissionRequiredMixin
+from utils.pagination import CursorPaginationMixin
 
 
 class SubscriberCreateView(PermissionRequiredMixin, CreateView):
@@ -18,21 +25,47 @@ class SubscriberCreateView(PermissionRequiredMixin, CreateView):
         return HttpResponseRedirect(self.success_url)
 
     def form_valid(self, form):
+        try:
+            response = super().form_valid(form)
+        except IntegrityError:
+            # подписчика с тем же email успели создать параллельно
+            form.add_error('email', 'Подписчик с указанным email уже с уществует')
+            return self.form_invalid(form)
         messages.success(self.request, 'Подписчик успешно создан')
-        return super().form_valid(form)
+        return response
 
 
-class SubscriberListView(PermissionRequiredMixin, ListView):
+class SubscriberListView(PermissionRequiredMixin, CursorPaginationMixin, ListView):
     model = Subscriber
     template_name = 'mail/subscribers_list.html'
+    paginate_by = settings.MAIL_SUBSCRIBERS_PER_PAGE
+    cursor_pagination = True
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         context['heading'] = 'Отправка писем'
         context['subscriber_form'] = SubscriberCreateForm()
         context['letter_form'] = LetterCreateForm()
+        # под WSGI прогресс отправки опрашивается короткими запросами, под ASGI - long-poll
+        context['progress_timeout'] = get_progress_timeout(self.request)
+        context['progress_poll_interval'] = settings.MAIL_PROGRESS_POLL_INTERVAL
         return context
 
     def get_queryset(self):
         qs = super().get_queryset()
-        return qs.with_counts()
+        return qs.only(*Subscriber.LIST_FIELDS).order_by('pk')
+
+
+class SubscriberExportView(PermissionRequiredMixin, ListView):
+    model = Subscriber
+
+    def get_queryset(self):
+        return super().get_queryset().order_by('pk').values_list(*Subscriber.LIST_FIELDS)
+
+    def render_to_response(self, context, **response_kwargs):
+        # строки пишутся в ответ по мере чтения из базы, весь файл в памяти не собирается
+        writer = csv.writer(Echo())
+        rows = iter_export_rows(self.object_list)
+        response = StreamingHttpResponse((writer.writerow(row) for row in rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="subscribers.csv"'
+        return response
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from events.models import Event, Review
+
+HOME_SNAPSHOT_KEY = 'main:home_snapshot'
+
+
+def build_home_snapshot():
+    # Только простые значения: снимок целиком лежит в кэше и не обращается к БД при выводе
+    events = Event.objects.order_by('-id')[:3]
+    reviews = Review.objects.select_related('user').order_by('-id')[:3]
+    return {
+        'event_list': [
+            {
+                'title': event.title,
+                'description': event.description,
+                'date_start': event.date_start,
+                'logo_url': event.logo_url,
+                'url': event.get_absolute_url(),
+            }
+            for event in events
+        ],
+        'review_list': [
+            {
+                'text': review.text,
+                'user_name': review.user.get_full_name() or review.user.username,
+            }
+            for review in reviews
+        ],
+    }
+
+
+def rebuild_home_snapshot():
+    snapshot = build_home_snapshot()
+    cache.set(HOME_SNAPSHOT_KEY, snapshot, settings.HOME_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def get_home_snapshot():
+    snapshot = cache.get(HOME_SNAPSHOT_KEY)
+    if snapshot is None:
+        snapshot = rebuild_home_snapshot()
+    return snapshot
@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from events.models import Event, Review
+from .cache import rebuild_home_snapshot
+
+
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=Review)
+def refresh_home_snapshot(**kwargs):
+    transaction.on_commit(rebuild_home_snapshot)
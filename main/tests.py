@@ -1,3 +1,40 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from events.models import Event, Review
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class HomeSnapshotTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('user', first_name='Анна', last_name='Иванова')
+        self.events = [
+            Event.objects.create(title=f'Событие {i}', date_start=timezone.now(), participants_number=10)
+            for i in range(4)
+        ]
+        Review.objects.create(user=self.user, event=self.events[0], rate=5, text='Отличное событие')
+
+    def get_titles(self):
+        return [event['title'] for event in self.client.get(reverse('main:index')).context['event_list']]
+
+    def test_warm_home_page_runs_no_queries(self):
+        self.client.get(reverse('main:index'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('main:index'))
+        self.assertEqual([event['title'] for event in response.context['event_list']],
+                         ['Событие 3', 'Событие 2', 'Событие 1'])
+        self.assertEqual(response.context['review_list'], [{'text': 'Отличное событие', 'user_name': 'Анна Иванова'}])
+
+    def test_snapshot_follows_event_changes(self):
+        self.assertEqual(self.get_titles(), ['Событие 3', 'Событие 2', 'Событие 1'])
+
+        Event.objects.create(title='Новое событие', date_start=timezone.now(), participants_number=10)
+        self.assertEqual(self.get_titles(), ['Новое событие', 'Событие 3', 'Событие 2'])
+
+        self.events[3].delete()
+        self.assertEqual(self.get_titles(), ['Новое событие', 'Событие 2', 'Событие 1'])
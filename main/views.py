@@ -1,6 +1,6 @@
 from django.views.generic import TemplateView
 
-from events.models import Event, Review
+from main.cache import get_home_snapshot
 
 
 class IndexView(TemplateView):
@@ -9,7 +9,6 @@ class IndexView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['special_content'] = True
-        context['event_list'] = Event.objects.all().order_by('-id')[:3]
-        context['review_list'] = Review.objects.all().order_by('-id')[:3]
+        context.update(get_home_snapshot())
         return context
 
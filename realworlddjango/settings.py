@@ -89,8 +89,6 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
-                'libraries':{
-                'realworlddjangotags': 'templatetags.realworlddjangotags'}
         },
     },
 ]
@@ -109,6 +107,21 @@ DATABASES = {
 }
 
 
+# Cache
+# Для нескольких воркеров нужен общий кэш, например CACHE_URL=rediscache://127.0.0.1:6379/1
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Время жизни закэшированных страниц списка событий (сек)
+EVENTS_LIST_CACHE_TIMEOUT = env.int('EVENTS_LIST_CACHE_TIMEOUT', default=300)
+
+# Снимок главной страницы пересобирается при изменении событий и отзывов;
+# срок жизни (сек) страхует от изменений в обход сигналов (массовые действия админки)
+HOME_SNAPSHOT_TIMEOUT = env.int('HOME_SNAPSHOT_TIMEOUT', default=3600)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -158,6 +171,21 @@ MEDIA_URL = '/assets/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Курсорная пагинация списка событий вместо постраничной (?page=N)
+EVENTS_CURSOR_PAGINATION = env.bool('EVENTS_CURSOR_PAGINATION', default=False)
+
+# Бэкенд полнотекстового поиска событий (по умолчанию выбирается по СУБД, см. events.search)
+EVENTS_SEARCH_BACKEND = env('EVENTS_SEARCH_BACKEND', default=None)
+
+# Количество отзывов на странице события и в одной порции «Показать еще»
+EVENTS_REVIEWS_PER_PAGE = env.int('EVENTS_REVIEWS_PER_PAGE', default=10)
+
+# Количество строк в разделе профиля (записи, отзывы, избранное) и в одной порции «Показать еще»
+ACCOUNTS_PROFILE_PAGE_SIZE = env.int('ACCOUNTS_PROFILE_PAGE_SIZE', default=20)
+
+# Максимальное количество отзывов в одном запросе пакетной загрузки
+EVENTS_REVIEWS_BATCH_LIMIT = env.int('EVENTS_REVIEWS_BATCH_LIMIT', default=5000)
+
 LOGIN_URL = reverse_lazy('accounts:sign_in')
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
@@ -181,13 +209,41 @@ ACCOUNT_EMAIL_REQUIRED = True
 ACCOUNT_AUTHENTICATION_METHOD = 'username_email'
 
 
-EMAIL_HOST = 'smtp.mail.ru'
-EMAIL_PORT = 2525
+EMAIL_HOST = env('EMAIL_HOST', default='smtp.mail.ru')
+EMAIL_PORT = env.int('EMAIL_PORT', default=2525)
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
-EMAIL_USE_TLS = True
+EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=True)
 EMAIL_USE_SSL = False
 
+# Рассылка: количество потоков (SMTP-соединений) и писем в одном send_messages
+MAIL_SENDER_WORKERS = env.int('MAIL_SENDER_WORKERS', default=4)
+MAIL_SENDER_BATCH_SIZE = env.int('MAIL_SENDER_BATCH_SIZE', default=100)
+
+# Очередь писем (команда mail_worker): опрос пустой очереди (сек), число попыток,
+# задержка повтора (сек, удваивается с каждой попыткой) и запас (сек) к сроку блокировки пачки:
+# письма зависшего обработчика возвращаются в очередь через этот запас плюс время отправки пачки
+MAIL_OUTBOX_POLL_INTERVAL = env.float('MAIL_OUTBOX_POLL_INTERVAL', default=5)
+MAIL_OUTBOX_MAX_ATTEMPTS = env.int('MAIL_OUTBOX_MAX_ATTEMPTS', default=5)
+MAIL_OUTBOX_RETRY_DELAY = env.int('MAIL_OUTBOX_RETRY_DELAY', default=60)
+MAIL_OUTBOX_RETRY_MAX_DELAY = env.int('MAIL_OUTBOX_RETRY_MAX_DELAY', default=3600)
+MAIL_OUTBOX_LOCK_TIMEOUT = env.int('MAIL_OUTBOX_LOCK_TIMEOUT', default=300)
+
+# Ограничения отправки (0 - без ограничения), общие для обработчиков через кэш:
+# писем в секунду, одновременных SMTP-соединений и писем в секунду на домен получателя
+# (MAIL_DOMAIN_RATE_LIMITS=mail.ru=5;gmail.com=20)
+MAIL_RATE_LIMIT = env.int('MAIL_RATE_LIMIT', default=10)
+MAIL_MAX_CONNECTIONS = env.int('MAIL_MAX_CONNECTIONS', default=4)
+MAIL_DOMAIN_RATE_LIMITS = env.dict('MAIL_DOMAIN_RATE_LIMITS', cast={'value': int}, default={})
+
+# Количество подписчиков на странице рассылки и в одной порции API get-subscribers
+MAIL_SUBSCRIBERS_PER_PAGE = env.int('MAIL_SUBSCRIBERS_PER_PAGE', default=50)
+
+# Прогресс рассылки: сколько держать long-poll запрос (сек, только под ASGI) и как часто проверять счетчики
+# рассылки (сек); под WSGI страница с тем же интервалом отправляет короткие запросы
+MAIL_PROGRESS_TIMEOUT = env.int('MAIL_PROGRESS_TIMEOUT', default=25)
+MAIL_PROGRESS_POLL_INTERVAL = env.float('MAIL_PROGRESS_POLL_INTERVAL', default=1)
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
@@ -36,6 +36,7 @@ urlpatterns += [
 urlpatterns += [
     path('api/events/', include('events.urls_api')),
     path('api/mail/', include('mail.urls_api')),
+    path('api/accounts/', include('accounts.urls_api')),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,172 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset-пагинация: страница выбирается условием WHERE по значениям полей сортировки
+    последнего показанного объекта, поэтому стоимость запроса не зависит от номера страницы.
+    Последнее поле сортировки должно быть уникальным (pk).
+    """
+    is_cursor = True
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.per_page = int(per_page)
+        self.ordering = list(ordering or queryset.query.order_by)
+        if not self.is_valid_ordering(queryset.model, self.ordering):
+            raise ValueError(f'Сортировка {self.ordering} не подходит для курсорной пагинации')
+
+    @staticmethod
+    def is_valid_ordering(model, ordering):
+        if not ordering or ordering[-1].lstrip('-') not in ('pk', model._meta.pk.name):
+            return False
+        for field_name in ordering:
+            name = field_name.lstrip('-')
+            if name == 'pk':
+                continue
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return False
+            if not field.concrete or field.is_relation:
+                return False
+        return True
+
+    def get_field(self, name):
+        return self.model._meta.pk if name == 'pk' else self.model._meta.get_field(name)
+
+    def encode_cursor(self, obj, reverse=False):
+        position = []
+        for name in self.ordering:
+            value = getattr(obj, self.get_field(name.lstrip('-')).attname)
+            # isoformat() сохраняет микросекунды, иначе граничный объект попадет на соседнюю страницу
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        data = json.dumps({'p': position, 'r': reverse})
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            position, reverse = data['p'], bool(data['r'])
+            if len(position) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            position = [self.get_field(name.lstrip('-')).to_python(value)
+                        for name, value in zip(self.ordering, position)]
+        except (binascii.Error, ValueError, TypeError, KeyError, ValidationError):
+            raise InvalidCursor(cursor)
+        return position, reverse
+
+    @staticmethod
+    def get_position_filter(ordering, position):
+        # (a, b) после (x, y) для сортировки по возрастанию: a > x OR (a = x AND b > y)
+        condition = Q()
+        equal = {}
+        for field_name, value in zip(ordering, position):
+            name = field_name.lstrip('-')
+            lookup = 'lt' if field_name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def page(self, cursor=None):
+        position, reverse = self.decode_cursor(cursor)
+        ordering = self.ordering
+        if reverse:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+        queryset = self.queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(ordering, position))
+
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if reverse:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        next_cursor, previous_cursor = None, None
+        if object_list and has_next:
+            next_cursor = self.encode_cursor(object_list[-1])
+        if object_list and has_previous:
+            previous_cursor = self.encode_cursor(object_list[0], reverse=True)
+        return CursorPage(object_list, self, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """
+    Курсорная пагинация для ListView. Включается атрибутом cursor_pagination
+    или параметром запроса cursor; если сортировка queryset не подходит
+    для keyset-пагинации, используется обычная постраничная.
+    """
+    cursor_pagination = False
+    cursor_kwarg = 'cursor'
+
+    def use_cursor_pagination(self):
+        return self.cursor_pagination or self.cursor_kwarg in self.request.GET
+
+    def get_cursor_query(self, cursor):
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        query[self.cursor_kwarg] = cursor or ''
+        return query.urlencode()
+
+    def is_cursor_pagination(self, model, ordering):
+        # Курсорная пагинация включена и сортировка ей подходит
+        return self.use_cursor_pagination() and CursorPaginator.is_valid_ordering(model, ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.is_cursor_pagination(queryset.model, queryset.query.order_by):
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Неверный курсор')
+
+        self.set_cursor_queries(page)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def set_cursor_queries(self, page):
+        page.first_query = self.get_cursor_query(None)
+        page.next_query = self.get_cursor_query(page.next_cursor)
+        page.previous_query = self.get_cursor_query(page.previous_cursor)
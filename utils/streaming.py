@@ -0,0 +1,31 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    JSON-ответ вида {**data, key: [...]}: элементы items кодируются и отдаются порциями
+    по chunk_size по мере чтения, поэтому весь список в памяти не собирается.
+    Для queryset в items стоит передавать queryset.iterator().
+    """
+
+    def __init__(self, data, key, items, encoder=DjangoJSONEncoder, chunk_size=1000, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(self.iter_json(data, key, items, encoder(), chunk_size), **kwargs)
+
+    @staticmethod
+    def iter_json(data, key, items, encoder, chunk_size):
+        data = {name: value for name, value in data.items() if name != key}
+        # '{..., "key": []}' без закрывающих '] }' - список дописывается частями
+        yield encoder.encode({**data, key: []})[:-2]
+        chunk = []
+        separator = ''
+        for item in items:
+            chunk.append(encoder.encode(item))
+            if len(chunk) >= chunk_size:
+                yield separator + ','.join(chunk)
+                chunk = []
+                separator = ','
+        if chunk:
+            yield separator + ','.join(chunk)
+        yield ']}'
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import tempfile
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+
+class ThreadedTransactionTestCase(TransactionTestCase):
+    """
+    Тесты с записью в базу из нескольких потоков. Общая in-memory база SQLite такой записи не допускает
+    (database table is locked), поэтому на время класса соединение переключается на копию тестовой базы
+    во временном файле. С другими СУБД и файловой SQLite ничего не меняется.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.memory_db = None
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            connection.ensure_connection()
+            cls.db_dir = tempfile.TemporaryDirectory()
+            path = os.path.join(cls.db_dir.name, 'test_db.sqlite3')
+            target = sqlite3.connect(path)
+            connection.connection.backup(target)
+            target.close()
+            # in-memory база живет, пока открыто ее соединение, поэтому оно откладывается, а не закрывается
+            cls.memory_db = (connection.settings_dict['NAME'], connection.connection)
+            connection.connection = None
+            connection.settings_dict['NAME'] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.memory_db:
+            connection.close()
+            connection.settings_dict['NAME'], connection.connection = cls.memory_db
+            cls.db_dir.cleanup()
+        super().tearDownClass()